@@ -9,12 +9,59 @@
 '''
 
 import datetime as dt
+import array
+import asyncio
+import bisect
+import collections
+import concurrent.futures
+import contextlib
 import hashlib
+import io
+import heapq
+import itertools
+import json
+import lzma
+import math
 import matplotlib.pyplot as plt
+import mmap
+import multiprocessing
+import multiprocessing.shared_memory
 import numpy as np
+import os
 import pandas as pd
+import queue
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
 import uuid
+import zipfile
+import zlib
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EPOCH = dt.datetime(1970, 1, 1)
+STATUSES = ['UNCOMMITTED', 'COMMITTED']
+TX_TIME = struct.Struct('<q')
+TX_VALUE = struct.Struct('<d')
+NAME_LENGTH = struct.Struct('<H')
+BLOCK_PREFIX = struct.Struct('<32s32sqq')
+BLOCK_NONCE = struct.Struct('<q')
+HEADER_FIELDS = struct.Struct('<qBBqqI')
+TX_COUNT = struct.Struct('<I')
+FRAME = struct.Struct('<IQ')
+HELLO = struct.Struct('<Q')
+CLOCK_LOCK = threading.Lock()
+LAST_TIMESTAMP = [0]
 
 def calc_hash(s):
     '''
@@ -34,79 +81,5461 @@ def calc_hash(s):
 
     return hashlib.sha256(str(s).encode('utf-8')).hexdigest()
 
-class PandasChain:
+def hash_bytes(h):
     '''
-    Class representing a blockchain
+    Converts a hex hash into its 32 raw bytes
+
+    Parameters
+    ----------
+    h : str
+        hex hash, or None.
+
+    Returns
+    -------
+    bytes
+        raw hash, 32 zero bytes for None.
+
     '''
-    
-    def __init__(self, name): 
-        '''
-        Constructor of the PandasChain class.
 
-        Parameters
-        ----------
-        name : str
-            name of the blockchain.
+    return bytes.fromhex(h) if h else bytes(32)
+
+def encode_name(name):
+    '''
+    Encodes a party name as a little-endian u16 length followed by its UTF-8
+    bytes
+
+    Parameters
+    ----------
+    name : str
+        name of the party.
+
+    Returns
+    -------
+    bytes
+        encoded name.
+
+    '''
+
+    data = str(name).encode('utf-8')
+    if len(data) > 0xFFFF:
+        raise ValueError('Party name longer than 65535 bytes')
+    return NAME_LENGTH.pack(len(data)) + data
+
+def decode_name(data, offset=0):
+    '''
+    Decodes a name written by encode_name
+
+    Parameters
+    ----------
+    data : bytes
+        buffer holding the encoded name.
+    offset : int, optional
+        position of the name in data. The default is 0.
+
+    Returns
+    -------
+    tuple
+        (name, offset after the name).
+
+    '''
+
+    size = NAME_LENGTH.unpack_from(data, offset)[0]
+    offset += NAME_LENGTH.size
+    return bytes(data[offset:offset + size]).decode('utf-8'), offset + size
+
+def update_transaction(h, ts, sender, receiver, value):
+    '''
+    Feeds the canonical encoding of a transaction into a hashlib object
+    without joining it into one buffer first. The encoding is the
+    timestamp as little-endian int64 nanoseconds, the sender and receiver
+    as written by encode_name, and the value as a little-endian float64.
+
+    Parameters
+    ----------
+    h : hashlib hash
+        hash to update.
+    ts : int
+        time of the transaction in nanoseconds since the epoch.
+    sender : bytes
+        sender encoded by encode_name.
+    receiver : bytes
+        receiver encoded by encode_name.
+    value : float
+        value of the coins transacted.
+
+    Returns
+    -------
+    hashlib hash
+        h.
+
+    '''
+
+    h.update(TX_TIME.pack(ts))
+    h.update(sender)
+    h.update(receiver)
+    h.update(TX_VALUE.pack(value))
+    return h
+
+def hash_transaction(ts, s, r, v):
+    '''
+    Calculates the hash of a transaction from its canonical encoding
+
+    Parameters
+    ----------
+    ts : int
+        time of the transaction in nanoseconds since the epoch.
+    s : str
+        Sender of the coins.
+    r : str
+        Receiver of the coins.
+    v : float
+        Value of the coins transacted.
+
+    Returns
+    -------
+    str
+        hash of the transaction.
+
+    '''
+
+    return update_transaction(hashlib.sha256(), ts, encode_name(s), encode_name(r), float(v)).hexdigest()
+
+def encode_transaction(ts, s, r, v):
+    '''
+    Encodes a transaction in the canonical encoding hashed by
+    update_transaction
+
+    Parameters
+    ----------
+    ts : int
+        time of the transaction in nanoseconds since the epoch.
+    s : str
+        Sender of the coins.
+    r : str
+        Receiver of the coins.
+    v : float
+        Value of the coins transacted.
+
+    Returns
+    -------
+    bytes
+        encoded transaction.
+
+    '''
+
+    return TX_TIME.pack(ts) + encode_name(s) + encode_name(r) + TX_VALUE.pack(float(v))
+
+def decode_transaction(data, offset=0):
+    '''
+    Decodes a transaction written by encode_transaction
+
+    Parameters
+    ----------
+    data : bytes
+        buffer holding the encoded transaction.
+    offset : int, optional
+        position of the transaction in data. The default is 0.
+
+    Returns
+    -------
+    tuple
+        ((ts, s, r, v), offset after the transaction).
+
+    '''
+
+    ts = TX_TIME.unpack_from(data, offset)[0]
+    s, offset = decode_name(data, offset + TX_TIME.size)
+    r, offset = decode_name(data, offset)
+    v = TX_VALUE.unpack_from(data, offset)[0]
+    return (ts, s, r, v), offset + TX_VALUE.size
+
+def encode_block_prefix(prev_hash, chain_id, commit_ts, seq_id):
+    '''
+    Encodes the block hash input before the nonce: the previous block hash
+    and chain id as 32 raw bytes, then the commit time and seq_id as
+    little-endian int64
+
+    Parameters
+    ----------
+    prev_hash : str
+        hash of the previous block, or None.
+    chain_id : str
+        ID of the chain.
+    commit_ts : int
+        commit time in nanoseconds since the epoch.
+    seq_id : int
+        sequence id of the block.
+
+    Returns
+    -------
+    bytes
+        encoded prefix.
+
+    '''
+
+    return BLOCK_PREFIX.pack(hash_bytes(prev_hash), hash_bytes(chain_id), commit_ts, seq_id)
+
+def hash_block(prefix, nonce, merkle_root):
+    '''
+    Calculates a block hash as sha256(prefix + int64 nonce + merkle root)
+
+    Parameters
+    ----------
+    prefix : bytes
+        output of encode_block_prefix.
+    nonce : int
+        nonce of the block.
+    merkle_root : str
+        merkle root of the block, or None.
+
+    Returns
+    -------
+    str
+        hash of the block.
+
+    '''
+
+    return hashlib.sha256(prefix + BLOCK_NONCE.pack(nonce) + hash_bytes(merkle_root)).hexdigest()
+
+def encode_header(header):
+    '''
+    Encodes a block header: seq_id, status, a presence flag per optional
+    field, commit_ts, nonce and size, followed by the 32 raw bytes of each
+    hash that is present
+
+    Parameters
+    ----------
+    header : dict
+        block metadata as returned by Block.get_header.
+
+    Returns
+    -------
+    bytes
+        encoded header.
+
+    '''
+
+    keys = ('prev_hash', 'block_hash', 'merkle_root')
+    flags = sum(1 << i for i, key in enumerate(keys) if header[key] is not None)
+    flags |= 8 if header['commit_ts'] is not None else 0
+    return HEADER_FIELDS.pack(header['seq_id'], STATUSES.index(header['status']), flags,
+                              header['commit_ts'] or 0, header['nonce'] or 0, header['size']) + \
+        b''.join(bytes.fromhex(header[key]) for key in keys if header[key] is not None)
+
+def decode_header(data, offset=0):
+    '''
+    Decodes a header written by encode_header
+
+    Parameters
+    ----------
+    data : bytes
+        buffer holding the encoded header.
+    offset : int, optional
+        position of the header in data. The default is 0.
+
+    Returns
+    -------
+    tuple
+        (header dict, offset after the header).
+
+    '''
+
+    seq_id, status, flags, commit_ts, nonce, size = HEADER_FIELDS.unpack_from(data, offset)
+    offset += HEADER_FIELDS.size
+    header = {'seq_id': seq_id, 'status': STATUSES[status]}
+    for i, key in enumerate(('prev_hash', 'block_hash', 'merkle_root')):
+        header[key] = None
+        if flags & 1 << i:
+            header[key] = bytes(data[offset:offset + 32]).hex()
+            offset += 32
+    header['size'] = size
+    header['commit_ts'] = commit_ts if flags & 8 else None
+    header['nonce'] = nonce if flags & 8 else None
+    return header, offset
+
+def encode_block(block):
+    '''
+    Encodes a block as its encode_header header, a u32 transaction count and
+    its transactions in the encode_transaction encoding
+
+    Parameters
+    ----------
+    block : Block
+        block to encode.
+
+    Returns
+    -------
+    bytes
+        encoded block.
+
+    '''
+
+    header = block.get_header()
+    parties, timestamps, senders, receivers, values, _ = block.get_columns()
+    n = header['size']
+    pack_time, pack_value, encoded = TX_TIME.pack, TX_VALUE.pack, parties.get_encoded
+    return b''.join([encode_header(header), TX_COUNT.pack(n)] +
+                    [pack_time(t) + encoded(s) + encoded(r) + pack_value(v)
+                     for t, s, r, v in zip(timestamps[:n].tolist(), senders[:n].tolist(),
+                                           receivers[:n].tolist(), values[:n].tolist())])
+
+def decode_block(data, parties):
+    '''
+    Decodes a block written by encode_block. The transaction hashes are
+    recomputed from the encoding and checked against the merkle root.
+
+    Parameters
+    ----------
+    data : bytes
+        encoded block.
+    parties : PartyDictionary
+        dictionary to intern the party names in.
+
+    Returns
+    -------
+    Block
+        the decoded block.
+
+    '''
+
+    header, offset = decode_header(data)
+    n = TX_COUNT.unpack_from(data, offset)[0]
+    offset += TX_COUNT.size
+    view = memoryview(data)
+    timestamps = np.empty(n, dtype=np.int64)
+    senders = np.empty(n, dtype=np.int32)
+    receivers = np.empty(n, dtype=np.int32)
+    values = np.empty(n, dtype=np.float64)
+    digests = []
+    for row in range(n):
+        start = offset
+        (timestamps[row], s, r, values[row]), offset = decode_transaction(data, offset)
+        senders[row], receivers[row] = parties.intern(s), parties.intern(r)
+        digests.append(hashlib.sha256(view[start:offset]).digest())
+    root = merkle_root(digests)
+    if (None if root is None else root.hex()) != header['merkle_root'] or n != header['size']:
+        raise ValueError('Block ' + str(header['seq_id']) + ' does not match its merkle root')
+    digests = np.frombuffer(b''.join(digests), dtype=np.uint8).reshape(n, 32)
+    return Block.from_columns(header, parties, timestamps, senders, receivers, values, digests)
+
+def recv_exact(sock, size):
+    '''
+    Receives exactly size bytes from a socket
+
+    Parameters
+    ----------
+    sock : socket
+        connected socket.
+    size : int
+        number of bytes.
+
+    Returns
+    -------
+    bytes
+        the received bytes.
+
+    '''
+
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        data += chunk
+    return bytes(data)
+
+def to_ns(ts):
+    '''
+    Converts a datetime into integer nanoseconds since the epoch
+
+    Parameters
+    ----------
+    ts : datetime
+        timestamp to convert.
+
+    Returns
+    -------
+    int
+        nanoseconds since 1970-01-01 00:00:00.
+
+    '''
+
+    return (ts - EPOCH) // dt.timedelta(microseconds=1) * 1000
+
+def reserve_timestamps(count=1):
+    '''
+    Reserves distinct transaction timestamps. The clock only has microsecond
+    resolution, so timestamps taken in the same microsecond are pushed past
+    the last one handed out; identical transactions never share a timestamp
+    and therefore never share a hash.
+
+    Parameters
+    ----------
+    count : int, optional
+        number of timestamps to reserve. The default is 1.
+
+    Returns
+    -------
+    int
+        first timestamp in nanoseconds since the epoch; the reserved
+        timestamps are first, first + 1, ..., first + count - 1.
+
+    '''
+
+    now = to_ns(dt.datetime.now())
+    with CLOCK_LOCK:
+        first = max(now, LAST_TIMESTAMP[0] + 1)
+        LAST_TIMESTAMP[0] = first + max(count, 1) - 1
+    return first
+
+def merkle_parent(left, right):
+    '''
+    Calculates the hash of an interior merkle tree node
+
+    Parameters
+    ----------
+    left : bytes
+        digest of the left child.
+    right : bytes
+        digest of the right child.
+
+    Returns
+    -------
+    bytes
+        digest of the parent node.
+
+    '''
+
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+def merkle_push(frontier, leaf):
+    '''
+    Pushes a leaf onto a merkle frontier
+
+    The frontier holds the roots of the perfect subtrees of the tree from left
+    to right as (size, digest) pairs, largest first, so a push only merges
+    equal sized subtrees.
+
+    Parameters
+    ----------
+    frontier : list
+        frontier of the tree, updated in place.
+    leaf : bytes
+        digest of the new leaf.
+
+    Returns
+    -------
+    None.
+
+    '''
+
+    size, node = 1, leaf
+    while frontier and frontier[-1][0] == size:
+        node = merkle_parent(frontier.pop()[1], node)
+        size *= 2
+    frontier.append((size, node))
+
+def merkle_fold(frontier):
+    '''
+    Folds a merkle frontier into the root of its tree
+
+    Parameters
+    ----------
+    frontier : list
+        frontier of the tree.
+
+    Returns
+    -------
+    bytes
+        merkle root, or None if the frontier is empty.
+
+    '''
+
+    if not frontier:
+        return None
+    root = frontier[-1][1]
+    for i in range(len(frontier) - 2, -1, -1):
+        root = merkle_parent(frontier[i][1], root)
+    return root
+
+def merkle_append(frontier, leaf):
+    '''
+    Appends a leaf to a merkle frontier and returns the new root using
+    O(log n) hashes
+
+    Parameters
+    ----------
+    frontier : list
+        frontier of the tree, updated in place.
+    leaf : bytes
+        digest of the new leaf.
+
+    Returns
+    -------
+    bytes
+        merkle root of the tree including the new leaf.
+
+    '''
+
+    merkle_push(frontier, leaf)
+    return merkle_fold(frontier)
+
+def merkle_root(leaves):
+    '''
+    Calculates the merkle root of a sequence of leaf digests
+
+    Parameters
+    ----------
+    leaves : iterable of bytes
+        leaf digests in order.
+
+    Returns
+    -------
+    bytes
+        merkle root, or None if there are no leaves.
+
+    '''
+
+    frontier = []
+    for leaf in leaves:
+        merkle_push(frontier, leaf)
+    return merkle_fold(frontier)
+
+def merkle_path_ranges(index, size):
+    '''
+    Returns the leaf ranges of the nodes on the path from a leaf to the root
+
+    The tree splits a range of n leaves at the largest power of two below n,
+    which is the same shape the frontier in merkle_push builds.
+
+    Parameters
+    ----------
+    index : int
+        position of the leaf.
+    size : int
+        number of leaves in the tree.
+
+    Returns
+    -------
+    list
+        (lo, hi) leaf ranges from the leaf up to the root.
+
+    '''
+
+    lo, hi = 0, size
+    ranges = [(lo, hi)]
+    while hi - lo > 1:
+        k = 1 << ((hi - lo - 1).bit_length() - 1)
+        if index < lo + k:
+            hi = lo + k
+        else:
+            lo = lo + k
+        ranges.append((lo, hi))
+    ranges.reverse()
+    return ranges
+
+def merkle_tree(leaves):
+    '''
+    Calculates every node a merkle proof can need, using n - 1 hashes
+
+    In the tree shape of merkle_path_ranges a node either covers an aligned
+    perfect subtree of 2**k leaves or lies on the right edge of the tree, so
+    the tree is kept as the digests of the perfect subtrees, level by level,
+    and the roots of the right edge nodes.
+
+    Parameters
+    ----------
+    leaves : list of bytes
+        leaf digests of the tree.
+
+    Returns
+    -------
+    tuple
+        (size, levels, edges): levels[k] concatenates the digests of the
+        subtrees of 2**k leaves in order, edges maps lo to the root of
+        leaves[lo:].
+
+    '''
+
+    levels = [b''.join(leaves)]
+    while len(levels[-1]) >= 64:
+        level = levels[-1]
+        levels.append(b''.join(merkle_parent(level[i:i + 32], level[i + 32:i + 64])
+                               for i in range(0, len(level) - 63, 64)))
+    size, edges = len(leaves), {}
+    lo, root = size, None
+    for k in range(size.bit_length()):
+        if size >> k & 1:
+            lo -= 1 << k
+            node = levels[k][(lo >> k) * 32:(lo >> k) * 32 + 32]
+            root = node if root is None else merkle_parent(node, root)
+            edges[lo] = root
+    return size, levels, edges
+
+def merkle_proof(leaves, index, tree=None):
+    '''
+    Returns the sibling hashes proving a leaf is part of a merkle tree
+
+    Parameters
+    ----------
+    leaves : list of bytes
+        leaf digests of the tree.
+    index : int
+        position of the leaf to prove.
+    tree : tuple, optional
+        merkle_tree of the leaves, so that each proof only costs O(log n)
+        lookups. The default is None, which builds it from leaves.
+
+    Returns
+    -------
+    list of bytes
+        sibling digests from the leaf up to the root.
+
+    '''
+
+    size, levels, edges = tree or merkle_tree(leaves)
+    ranges = merkle_path_ranges(index, size)
+    path = []
+    for (lo, hi), (parent_lo, parent_hi) in zip(ranges, ranges[1:]):
+        start, stop = (hi, parent_hi) if lo == parent_lo else (parent_lo, lo)
+        if stop == size and start in edges:
+            path.append(edges[start])
+        else:
+            k = (stop - start).bit_length() - 1
+            path.append(levels[k][(start >> k) * 32:(start >> k) * 32 + 32])
+    return path
+
+def verify_proofs(batch):
+    '''
+    Verifies a batch of merkle inclusion proofs made by PandasChain.get_proof
+
+    Nodes proven for a block are remembered, so proofs for the same block stop
+    hashing as soon as they reach a node that is already verified.
+
+    Parameters
+    ----------
+    batch : iterable of dict
+        proofs returned by PandasChain.get_proof.
+
+    Returns
+    -------
+    list of bool
+        whether each proof is valid.
+
+    '''
+
+    verified = {}
+    results = []
+    for proof in batch:
+        header = proof['header']
+        root = header['merkle_root']
+        known = verified.setdefault((header['block_hash'], root), {})
+        ranges = merkle_path_ranges(proof['index'], header['size'])
+        path = proof['path']
+        if len(path) != len(ranges) - 1 or not 0 <= proof['index'] < header['size']:
+            results.append(False)
+            continue
+        node = bytes.fromhex(proof['tx_hash'])
+        seen = []
+        valid = None
+        for i, sibling in enumerate(path):
+            if ranges[i] in known:
+                valid = known[ranges[i]] == node
+                break
+            seen.append((ranges[i], node))
+            sibling = bytes.fromhex(sibling)
+            if ranges[i][0] == ranges[i + 1][0]:
+                node = merkle_parent(node, sibling)
+            else:
+                node = merkle_parent(sibling, node)
+        if valid is None:
+            valid = node.hex() == root
+            seen.append((ranges[-1], node))
+        if valid:
+            known.update(seen)
+        results.append(valid)
+    return results
+
+def validate_blocks(blocks):
+    '''
+    Re-derives the merkle root of each block and checks the prev_hash links
+    between consecutive blocks. Used by PandasChain.validate for one range
+    of blocks.
+
+    Parameters
+    ----------
+    blocks : iterable of tuple
+        (seq_id, prev_hash, block_hash, merkle_root, digests) of contiguous
+        blocks, where digests is a uint8 array of the transaction hashes.
+
+    Returns
+    -------
+    tuple
+        (sequence id of the first corrupt block or None if all are valid,
+        prev_hash of the first block, block_hash of the last block).
+
+    '''
+
+    first_prev_hash = prev_block_hash = None
+    for i, (seq_id, prev_hash, block_hash, merkle_hash, digests) in enumerate(blocks):
+        if not i:
+            first_prev_hash = prev_hash
+        root = merkle_root(digests[row].tobytes() for row in range(digests.shape[0]))
+        if (None if root is None else root.hex()) != merkle_hash or (i and prev_hash != prev_block_hash):
+            return seq_id, first_prev_hash, None
+        prev_block_hash = block_hash
+    return None, first_prev_hash, prev_block_hash
+
+def read_segment_blocks(locations):
+    '''
+    Reads the headers and transaction hashes of blocks straight from their
+    segment files. Used by the PandasChain.validate workers, which map the
+    segments themselves instead of receiving the blocks.
+
+    Parameters
+    ----------
+    locations : list of tuple
+        (segment filename, offset) of each block, see
+        SegmentStore.get_locations.
+
+    Returns
+    -------
+    generator
+        (seq_id, prev_hash, block_hash, merkle_root, digests) of each block.
+
+    '''
+
+    maps = {}
+    try:
+        for filename, offset in locations:
+            if filename not in maps:
+                with open(filename, 'rb') as f:
+                    maps[filename] = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            mm = maps[filename]
+            (_, n, seq_id, _, _, flags, prev_hash, block_hash, merkle_hash,
+             _, _, _) = SegmentStore.RECORD.unpack_from(mm, offset)
+            pos = offset + SegmentStore.RECORD.size + 16 * n
+            yield (seq_id, prev_hash.hex() if flags & 1 else None, block_hash.hex(),
+                   merkle_hash.hex() if flags & 2 else None,
+                   np.frombuffer(mm[pos:pos + 32 * n], dtype=np.uint8).reshape(n, 32))
+    finally:
+        for mm in maps.values():
+            mm.close()
+
+def read_shared_blocks(name, headers):
+    '''
+    Reads the transaction hashes of blocks from a shared memory block. Used
+    by the PandasChain.validate workers for chains kept in memory.
+
+    Parameters
+    ----------
+    name : str
+        name of the SharedMemory holding the digests of the chain.
+    headers : list of tuple
+        (seq_id, prev_hash, block_hash, merkle_root, first row, rows) of
+        each block.
+
+    Returns
+    -------
+    generator
+        (seq_id, prev_hash, block_hash, merkle_root, digests) of each block.
+
+    '''
+
+    shm = multiprocessing.shared_memory.SharedMemory(name)
+    try:
+        for seq_id, prev_hash, block_hash, merkle_hash, start, rows in headers:
+            yield (seq_id, prev_hash, block_hash, merkle_hash,
+                   np.frombuffer(shm.buf[32 * start:32 * (start + rows)], dtype=np.uint8).reshape(rows, 32).copy())
+    finally:
+        shm.close()
+
+def validate_range(reader, args):
+    '''
+    Body of a PandasChain.validate worker: reads a range of blocks with
+    reader and validates it
+
+    Parameters
+    ----------
+    reader : callable
+        read_segment_blocks or read_shared_blocks.
+    args : tuple
+        arguments of reader.
+
+    Returns
+    -------
+    tuple
+        see validate_blocks.
+
+    '''
+
+    return validate_blocks(reader(*args))
+
+def mine_range(prefix, suffix, difficulty, start, step, stop, results):
+    '''
+    Searches the nonces start, start + step, ... for a block hash with
+    difficulty leading zero bits. Used by the NonceMiner workers.
+
+    Parameters
+    ----------
+    prefix : bytes
+        block hash input before the nonce.
+    suffix : bytes
+        block hash input after the nonce.
+    difficulty : int
+        required number of leading zero bits.
+    start : int
+        first nonce to try.
+    step : int
+        distance between the nonces tried.
+    stop : Event
+        set by whichever worker finds a nonce; checked between chunks.
+    results : Queue
+        receives (nonce or None, hashes tried) when the worker stops.
+
+    Returns
+    -------
+    None.
+
+    '''
+
+    midstate = hashlib.sha256(prefix)
+    target = 1 << (256 - difficulty)
+    nonce, tried = start, 0
+    while not stop.is_set():
+        for _ in range(4096):
+            h = midstate.copy()
+            h.update(BLOCK_NONCE.pack(nonce) + suffix)
+            tried += 1
+            if int.from_bytes(h.digest(), 'big') < target:
+                stop.set()
+                results.put((nonce, tried))
+                return
+            nonce += step
+    results.put((None, tried))
+
+def run_miner(tasks, stop, results):
+    '''
+    Body of a NonceMiner worker process: runs mine_range for each
+    (prefix, suffix, difficulty, start, step) job on tasks until it receives
+    None
+
+    Parameters
+    ----------
+    tasks : Queue
+        jobs of this worker.
+    stop : Event
+        set by whichever worker finds a nonce.
+    results : Queue
+        receives (nonce or None, hashes tried) for each job.
+
+    Returns
+    -------
+    None.
+
+    '''
+
+    for prefix, suffix, difficulty, start, step in iter(tasks.get, None):
+        mine_range(prefix, suffix, difficulty, start, step, stop, results)
+
+def mine_nonce(prefix, suffix, difficulty, processes=None):
+    '''
+    Finds a nonce so that sha256(prefix + int64 nonce + suffix) has at least
+    difficulty leading zero bits with a NonceMiner that lives for this call
+    only. Chains that mine many blocks keep one NonceMiner instead.
+
+    Parameters
+    ----------
+    prefix : bytes
+        block hash input before the nonce.
+    suffix : bytes
+        block hash input after the nonce.
+    difficulty : int
+        required number of leading zero bits.
+    processes : int, optional
+        number of worker processes, 1 to search in this process. The default
+        is None, which uses every CPU.
+
+    Returns
+    -------
+    tuple
+        (nonce, number of hashes tried).
+
+    '''
+
+    with NonceMiner(processes) as miner:
+        return miner.mine(prefix, suffix, difficulty)
+
+def run_shard(name, options, conn):
+    '''
+    Body of a ShardedPandasChain shard process: owns one PandasChain and
+    answers (method, args) requests on conn with ('ok', result) or
+    ('error', exception) until it receives None
+
+    Parameters
+    ----------
+    name : str
+        name of the shard chain.
+    options : dict
+        keyword arguments of the PandasChain.
+    conn : Connection
+        pipe end to the ShardedPandasChain.
+
+    Returns
+    -------
+    None.
+
+    '''
+
+    chain = PandasChain(name, **options)
+    while True:
+        request = conn.recv()
+        if request is None:
+            chain.close()
+            conn.close()
+            return
+        method, args = request
+        try:
+            conn.send(('ok', getattr(chain, method)(*args)))
+        except Exception as e:
+            conn.send(('error', e))
+
+def write_npy_stream(archive, name, dtype, shape, chunks):
+    '''
+    Writes an array into a zip archive as an .npy entry chunk by chunk, so the
+    whole array never has to be in memory
+
+    Parameters
+    ----------
+    archive : ZipFile
+        archive opened for writing.
+    name : str
+        name of the array in the archive.
+    dtype : dtype
+        dtype of the array.
+    shape : tuple
+        shape of the whole array.
+    chunks : iterable of ndarray
+        consecutive pieces of the array along its first axis.
+
+    Returns
+    -------
+    None.
+
+    '''
+
+    with archive.open(name + '.npy', 'w', force_zip64=True) as f:
+        np.lib.format.write_array_header_2_0(f, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                 'fortran_order': False, 'shape': shape})
+        for chunk in chunks:
+            f.write(np.ascontiguousarray(chunk, dtype=dtype).tobytes())
+
+def merge_runs(left, right):
+    '''
+    Merges two sorted runs of a transaction index in linear time
+
+    Parameters
+    ----------
+    left : tuple
+        (keys, locations) of the first run, keys sorted.
+    right : tuple
+        (keys, locations) of the second run, keys sorted.
+
+    Returns
+    -------
+    tuple
+        (keys, locations) of the merged run.
+
+    '''
+
+    n = left[0].size + right[0].size
+    at = np.searchsorted(left[0], right[0], 'right') + np.arange(right[0].size)
+    from_left = np.ones(n, dtype=bool)
+    from_left[at] = False
+    merged = []
+    for a, b in zip(left, right):
+        column = np.empty(n, dtype=a.dtype)
+        column[at] = b
+        column[from_left] = a
+        merged.append(column)
+    return tuple(merged)
+
+class Instruments:
+    '''
+    Per-stage timers and counters of a PandasChain. Stages are timed with
+    time.perf_counter; a callback, if given, is called with the stage, its
+    elapsed seconds and its counter increments after every timed stage.
+    '''
+
+    def __init__(self, callback=None):
+        '''
+        Constructor of the Instruments class
+
+        Parameters
+        ----------
+        callback : callable, optional
+            called as callback(stage, seconds, counts). The default is None.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__callback = callback
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''
+        Clears every timer and counter
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        with self.__lock:
+            self.__counters = collections.Counter()
+            self.__calls = collections.Counter()
+            self.__seconds = collections.defaultdict(float)
+
+    def set_callback(self, callback):
+        '''
+        Replaces the callback
+
+        Parameters
+        ----------
+        callback : callable
+            called as callback(stage, seconds, counts), or None.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__callback = callback
+
+    def record(self, stage, start, **counts):
+        '''
+        Records a stage that started at start
+
+        Parameters
+        ----------
+        stage : str
+            name of the stage.
+        start : float
+            time.perf_counter() when the stage started.
+        **counts : int
+            counters to increment, e.g. bytes_hashed.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        seconds = time.perf_counter() - start
+        with self.__lock:
+            self.__calls[stage] += 1
+            self.__seconds[stage] += seconds
+            self.__counters.update(counts)
+        if self.__callback is not None:
+            self.__callback(stage, seconds, counts)
+
+    def stats(self):
+        '''
+        Returns the timers and counters
+
+        Returns
+        -------
+        dict
+            counters, and calls and seconds per stage.
+
+        '''
+
+        with self.__lock:
+            return {'counters': dict(self.__counters),
+                    'stages': {stage: {'calls': self.__calls[stage], 'seconds': self.__seconds[stage]}
+                               for stage in self.__calls}}
+
+class BloomFilter:
+    '''
+    Bloom filter over keys given as a pair of 64-bit hashes (see key_hashes).
+    Sized for capacity keys at the requested false positive rate; probe i
+    of a key is bit (h1 + i * h2) mod bits.
+    '''
+
+    def __init__(self, capacity, fp_rate=0.01):
+        '''
+        Constructor of the BloomFilter class
+
+        Parameters
+        ----------
+        capacity : int
+            number of keys the filter is sized for.
+        fp_rate : float, optional
+            false positive rate at capacity keys. The default is 0.01.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        capacity = max(int(capacity), 1)
+        self.__bits = max(64, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.__hashes = max(1, round(self.__bits / capacity * math.log(2)))
+        self.__array = np.zeros((self.__bits + 7) // 8, dtype=np.uint8)
+
+    @staticmethod
+    def key_hashes(key):
+        '''
+        Returns the two 64-bit hashes of a key
+
+        Parameters
+        ----------
+        key : bytes
+            the key.
+
+        Returns
+        -------
+        tuple
+            (h1, h2), h2 odd.
+
+        '''
+
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def __positions(self, h1, h2):
+        '''
+        Returns the bit positions of keys
+
+        Parameters
+        ----------
+        h1, h2 : ndarray
+            uint64 hashes of the keys.
+
+        Returns
+        -------
+        ndarray
+            positions, one row per probe.
+
+        '''
+
+        probes = np.arange(self.__hashes, dtype=np.uint64)[:, None]
+        return (np.asarray(h1, dtype=np.uint64) + probes * np.asarray(h2, dtype=np.uint64)) % np.uint64(self.__bits)
+
+    def add(self, h1, h2):
+        '''
+        Adds keys to the filter
+
+        Parameters
+        ----------
+        h1, h2 : ndarray
+            uint64 hashes of the keys.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        positions = self.__positions(h1, h2).ravel()
+        np.bitwise_or.at(self.__array, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+    def might_contain(self, h1, h2):
+        '''
+        Tests a key
+
+        Parameters
+        ----------
+        h1, h2 : int
+            hashes of the key.
+
+        Returns
+        -------
+        bool
+            False if the key was never added, True if it probably was.
+
+        '''
+
+        bits = self.__bits
+        array = self.__array
+        for i in range(self.__hashes):
+            position = (h1 + i * h2) % (1 << 64) % bits
+            if not array[position >> 3] >> (position & 7) & 1:
+                return False
+        return True
+
+    def get_nbytes(self):
+        '''
+        Returns the size of the bit array
+
+        Returns
+        -------
+        int
+            bytes used by the filter bits.
+
+        '''
+
+        return self.__array.nbytes
+
+class CommitPolicy:
+    '''
+    Class deciding when the open block of a PandasChain is sealed
+    '''
+
+    def __init__(self, max_transactions=10, max_bytes=None, max_age=None):
+        '''
+        Constructor of the CommitPolicy class. A block is sealed as soon as
+        any of the limits is reached.
+
+        Parameters
+        ----------
+        max_transactions : int, optional
+            maximum number of transactions in a block. The default is 10.
+        max_bytes : int, optional
+            maximum size of the transaction columns of a block in bytes. The
+            default is None, no limit.
+        max_age : float, optional
+            maximum seconds between the first transaction of a block and its
+            seal. The default is None, no limit.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.max_transactions = max_transactions
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def room(self, block):
+        '''
+        Returns how many more transactions fit in a block
+
+        Parameters
+        ----------
+        block : Block
+            open block.
+
+        Returns
+        -------
+        int
+            number of transactions the block can still take.
+
+        '''
+
+        room = self.max_transactions - block.get_size()
+        if self.max_bytes is not None:
+            room = min(room, (self.max_bytes - block.get_nbytes()) // Block.TX_BYTES)
+        return max(room, 0)
+
+    def expires_in(self, block):
+        '''
+        Returns the seconds until a block reaches max_age
+
+        Parameters
+        ----------
+        block : Block
+            open block.
+
+        Returns
+        -------
+        float
+            seconds left, or None if there is no age limit or the block is
+            empty.
+
+        '''
+
+        if self.max_age is None or block.get_size() == 0:
+            return None
+        return self.max_age - (to_ns(dt.datetime.now()) - block.get_first_timestamp()) / 1e9
+
+    def is_full(self, block):
+        '''
+        Returns whether a block must be sealed
+
+        Parameters
+        ----------
+        block : Block
+            open block.
+
+        Returns
+        -------
+        bool
+            True if any limit of the policy is reached.
+
+        '''
+
+        if self.room(block) == 0:
+            return True
+        expires_in = self.expires_in(block)
+        return expires_in is not None and expires_in <= 0
+
+class ArchivePolicy:
+    '''
+    Class deciding when the committed blocks of an in-memory PandasChain are
+    moved out of memory into compressed archive tiers
+    '''
+
+    CODECS = {'zlib': (zlib.compress, zlib.decompress), 'lzma': (lzma.compress, lzma.decompress)}
+
+    def __init__(self, tiers=((100, 'zlib'), (10000, 'lzma')), group_blocks=64, cache_blocks=16, directory=None):
+        '''
+        Constructor of the ArchivePolicy class
+
+        Parameters
+        ----------
+        tiers : tuple, optional
+            (age, codec) pairs: a block is archived with codec once age blocks
+            were committed after it, and moves to the next tier when it gets
+            older still. Codecs are 'zlib' and 'lzma'. The default is
+            ((100, 'zlib'), (10000, 'lzma')).
+        group_blocks : int, optional
+            blocks archived together in one file; a group moves when its
+            newest block is old enough. The default is 64.
+        cache_blocks : int, optional
+            rehydrated blocks kept in the LRU cache. The default is 16.
+        directory : str, optional
+            directory to create the archive in. The default is None, the
+            system temporary directory.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        for _, codec in tiers:
+            if codec not in self.CODECS:
+                raise ValueError('Unknown archive codec ' + str(codec))
+        self.tiers = sorted(tiers)
+        self.group_blocks = group_blocks
+        self.cache_blocks = cache_blocks
+        self.directory = directory
+
+class NonceMiner:
+    '''
+    Persistent worker processes searching for block nonces. The workers are
+    started once, by the thread creating the miner, and wait for jobs, so
+    each search only pays for hashing. The nonce space is interleaved across
+    the workers, which all stop once any of them succeeds. With one process
+    the search runs in the calling thread. One search runs at a time.
+    '''
+
+    def __init__(self, processes=None):
+        '''
+        Constructor of the NonceMiner class. Starts the worker processes.
+
+        Parameters
+        ----------
+        processes : int, optional
+            number of worker processes, 1 to search in the calling thread.
+            The default is None, which uses every CPU.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__processes = processes or os.cpu_count() or 1
+        self.__workers = []
+        if self.__processes > 1:
+            context = multiprocessing.get_context()
+            self.__stop = context.Event()
+            self.__results = context.Queue()
+            self.__tasks = [context.Queue() for _ in range(self.__processes)]
+            self.__workers = [context.Process(target=run_miner, args=(tasks, self.__stop, self.__results), daemon=True)
+                              for tasks in self.__tasks]
+            for worker in self.__workers:
+                worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def mine(self, prefix, suffix, difficulty):
+        '''
+        Finds a nonce so that sha256(prefix + int64 nonce + suffix) has at
+        least difficulty leading zero bits
+
+        Parameters
+        ----------
+        prefix : bytes
+            block hash input before the nonce.
+        suffix : bytes
+            block hash input after the nonce.
+        difficulty : int
+            required number of leading zero bits.
+
+        Returns
+        -------
+        tuple
+            (nonce, number of hashes tried).
+
+        '''
+
+        if not self.__workers:
+            results = queue.Queue()
+            mine_range(prefix, suffix, difficulty, 0, 1, threading.Event(), results)
+            return results.get()
+        self.__stop.clear()
+        for i, tasks in enumerate(self.__tasks):
+            tasks.put((prefix, suffix, difficulty, i, self.__processes))
+        nonce, tried = None, 0
+        for _ in self.__workers:
+            found, count = self.__results.get()
+            tried += count
+            if nonce is None:
+                nonce = found
+        return nonce, tried
+
+    def close(self):
+        '''
+        Stops the worker processes
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        for tasks in self.__tasks if self.__workers else ():
+            tasks.put(None)
+        for worker in self.__workers:
+            worker.join()
+        self.__workers = []
+
+class PandasChain:
+    '''
+    Class representing a blockchain
+    '''
+
+    INDEX_MERGE_ROWS = 4096
+    INDEX_RUN_ROWS = 1 << 20
+    PROOF_CACHE_BLOCKS = 16
+    
+    def __init__(self, name, path=None, fsync='always', policy=None, background=False, difficulty=0,
+                 mining_processes=None, instruments=False, bloom_fp_rate=0.01, archive=None): 
+        '''
+        Constructor of the PandasChain class.
+
+        Parameters
+        ----------
+        name : str
+            name of the blockchain.
+        path : str, optional
+            directory of a segment store to persist committed blocks in. An
+            existing store is reopened and the chain continues from its last
+            block. The default is None, which keeps the chain in memory.
+        fsync : str or int, optional
+            fsync policy of the segment store: 'always', 'never' or every N
+            blocks. The default is 'always'.
+        policy : CommitPolicy, optional
+            when to seal the open block. The default is None, which seals
+            blocks at 10 transactions.
+        background : bool, optional
+            commit sealed blocks on a background committer thread instead of
+            on the caller's thread. The default is False.
+        difficulty : int, optional
+            number of leading zero bits a block hash needs. Above 0 each
+            commit searches for a nonce (proof of work) instead of salting the
+            hash with a random number. The default is 0.
+        mining_processes : int, optional
+            number of processes searching for a nonce. They are started with
+            the first difficulty above 0 and live until close. The default is
+            None, which uses every CPU.
+        instruments : bool or Instruments, optional
+            collect per-stage timers and counters, see stats. The default is
+            False.
+        bloom_fp_rate : float, optional
+            false positive rate of the per-block participant filters used by
+            transactions_for. The default is 0.01.
+        archive : ArchivePolicy, optional
+            keep only the headers of old committed blocks in memory and their
+            transactions in compressed archives. Only for in-memory chains.
+            The default is None.
+
+        Returns
+        -------
+        None.
+
+        '''
+        
+        self.__name = name.upper()
+        self.__id = calc_hash(str(uuid.uuid4()) + self.__name + str(dt.datetime.now()))
+        self.__seq_id = 0
+        self.__prev_hash = None
+        self.__new_index = (array.array('Q'), array.array('q'))
+        self.__index_runs = []
+        self.__merkle_trees = collections.OrderedDict()
+        self.__policy = policy or CommitPolicy()
+        self.__parties = PartyDictionary()
+        if path is None:
+            self.__chain = [] if archive is None else ArchiveStore(self.__parties, archive)
+        elif archive is not None:
+            raise ValueError('A chain in a segment store keeps its blocks on disk already')
+        else:
+            self.__chain = SegmentStore(path, self.__id, self.__parties, fsync=fsync)
+            self.__id = self.__chain.get_chain_id()
+            self.__seq_id = len(self.__chain)
+            self.__prev_hash = self.__chain.get_last_hash()
+        self.__unindexed_blocks = self.__seq_id
+        self.__balances = {} if self.__seq_id == 0 else None
+        self.__block_min_ts = array.array('q')
+        self.__block_max_ts = array.array('q')
+        self.__ts_ordered = True
+        self.__blooms = []
+        self.__bloom_fp_rate = bloom_fp_rate
+        self.__bloom_queries = [0, 0, 0]
+        self.__party_hashes = (array.array('Q'), array.array('Q'))
+        self.__current_block = Block(self.__seq_id, self.__prev_hash, min(self.__policy.max_transactions, 4096), self.__parties)
+        self.__sealed = collections.deque()
+        self.__lock = threading.RLock()
+        self.__sealed_changed = threading.Condition(self.__lock)
+        self.__committer = None
+        self.__commit_listeners = []
+        self.__difficulty = 0
+        self.__mining_processes = mining_processes
+        self.__miner = None
+        self.__mining_stats = {}
+        self.set_difficulty(difficulty)
+        self.__instruments = None
+        if instruments:
+            self.set_instruments(instruments)
+        if background:
+            self.__committer = threading.Thread(target=self.__run_committer, name=self.__name + '-committer', daemon=True)
+            self.__running = True
+            self.__committer.start()
+        if self.__seq_id:
+            print(self.__name,'PandasChain reopened with ID',self.__id,'at block',self.__seq_id)
+        else:
+            print(self.__name,'PandasChain created with ID',self.__id,'chain started.')
+
+    def flush(self):
+        '''
+        Seals the current block if it holds any transactions and waits until
+        every sealed block is committed
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        with self.__lock:
+            if self.__current_block.get_size():
+                self.__seal_block()
+            while self.__committer is not None and self.__sealed:
+                self.__sealed_changed.wait()
+
+    def close(self):
+        '''
+        Flushes the chain, stops the committer thread and the mining workers
+        and closes the segment store of a persistent chain
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.flush()
+        if self.__committer is not None:
+            with self.__lock:
+                self.__running = False
+                self.__sealed_changed.notify_all()
+            self.__committer.join()
+            self.__committer = None
+        if self.__miner is not None:
+            self.__miner.close()
+            self.__miner = None
+        if isinstance(self.__chain, (SegmentStore, ArchiveStore)):
+            self.__chain.close()
+
+    def set_instruments(self, instruments=True, callback=None):
+        '''
+        Turns instrumentation on or off. While it is off the hot paths only
+        test for None.
+
+        Parameters
+        ----------
+        instruments : bool or Instruments, optional
+            True for new Instruments, an Instruments to share, or False to
+            turn instrumentation off. The default is True.
+        callback : callable, optional
+            called as callback(stage, seconds, counts) after every timed
+            stage. The default is None.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        if instruments is True:
+            instruments = Instruments(callback)
+        elif instruments:
+            if callback is not None:
+                instruments.set_callback(callback)
+        else:
+            instruments = None
+        with self.__lock:
+            self.__instruments = instruments
+            for block in list(self.__sealed) + [self.__current_block]:
+                block.set_instruments(instruments)
+
+    def stats(self):
+        '''
+        Returns the instrumentation timers and counters. Counters are
+        transactions_added, blocks_committed, bytes_hashed and bytes_stored;
+        stages are ingest, hashing, merkle, commit, mining, storage and
+        output.
+
+        Returns
+        -------
+        dict
+            counters, and calls and seconds per stage, or None when
+            instrumentation is off.
+
+        '''
+
+        return None if self.__instruments is None else self.__instruments.stats()
+
+    def display_chain(self, start=None, stop=None, tail=None, offset=0, limit=None, format='text', file=None): 
+        '''
+        Displays the blockchain block by block through a buffered
+        ChainRenderer, so only one chunk of one block is rendered at a time
+
+        Parameters
+        ----------
+        start : int, optional
+            first seq_id to display. The default is None, the first block.
+        stop : int, optional
+            seq_id to stop before. The default is None, after the last block.
+        tail : int, optional
+            display only the last tail blocks of the selection. The default is
+            None.
+        offset : int, optional
+            transactions of the selection to skip. The default is 0.
+        limit : int, optional
+            most transactions to display. The default is None, no limit.
+        format : str, optional
+            'text', 'csv' or 'binary', see ChainRenderer. The default is 'text'.
+        file : file, optional
+            stream to write to. The default is None, which writes to stdout.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        with ChainRenderer(file, format) as renderer:
+            for block in self.__select_blocks(start, stop, tail):
+                size = block.get_size()
+                if offset > 0 and offset >= size:
+                    offset -= size
+                    continue
+                if limit is not None and limit <= 0:
+                    break
+                rows = size - offset if limit is None else min(size - offset, limit)
+                renderer.write_header(block, size)
+                renderer.write_transactions(block, offset, offset + rows)
+                offset = 0
+                if limit is not None:
+                    limit -= rows
+
+    def __select_blocks(self, start=None, stop=None, tail=None, headers=False):
+        '''
+        Iterates over a seq_id range of the blocks as they were when the
+        iteration started
+
+        Parameters
+        ----------
+        start : int, optional
+            first seq_id. The default is None, the first block.
+        stop : int, optional
+            seq_id to stop before. The default is None, after the last block.
+        tail : int, optional
+            keep only the last tail blocks of the range. The default is None.
+        headers : bool, optional
+            yield the headers instead, without rehydrating archived blocks.
+            The default is False.
+
+        Returns
+        -------
+        generator
+            blocks or headers in sequence order.
+
+        '''
+
+        with self.__lock:
+            committed = len(self.__chain)
+            open_blocks = list(self.__sealed) + [self.__current_block]
+        first, last, _ = slice(start, stop).indices(committed + len(open_blocks))
+        if tail is not None:
+            first = max(first, last - tail)
+        archived = headers and isinstance(self.__chain, ArchiveStore)
+        for seq_id in range(first, last):
+            if seq_id >= committed:
+                block = open_blocks[seq_id - committed]
+            else:
+                block = self.__chain.get_header(seq_id) if archived else self.__chain[seq_id]
+            yield block.get_header() if headers and not isinstance(block, dict) else block
+    
+    def add_transaction(self, s, r, v): 
+        '''
+        Adds a transaction to the blockchain
+
+        Parameters
+        ----------
+        s : str
+            Sender of the coins.
+        r : str
+            Receiver of the coins.
+        v : float
+            Value of the coins transacted.
+
+        Returns
+        -------
+        str
+            hash of the transaction.
+
+        '''
+        
+        v = float(v)
+        instruments = self.__instruments
+        if instruments is not None:
+            start = time.perf_counter()
+        with self.__lock:
+            if self.__policy.is_full(self.__current_block):
+                self.__seal_block()
+            tx_hash = self.__current_block.add_transaction(s, r, v)
+            if self.__balances is not None:
+                self.__balances[s] = self.__balances.get(s, 0.0) - v
+                self.__balances[r] = self.__balances.get(r, 0.0) + v
+            self.__index_transaction(int.from_bytes(bytes.fromhex(tx_hash)[:8], 'little'),
+                                     self.__seq_id << 32 | self.__current_block.get_size() - 1)
+            self.__wake_committer()
+        if instruments is not None:
+            instruments.record('ingest', start, transactions_added=1)
+        return tx_hash
+
+    def add_transactions(self, senders, receivers=None, values=None):
+        '''
+        Adds many transactions to the blockchain in one call. The input is
+        split into block-sized slices, each slice is hashed in one pass and as
+        many blocks as needed are committed. Blocks and hashes are the same as
+        calling add_transaction for each transaction.
+
+        Parameters
+        ----------
+        senders : list, ndarray or DataFrame
+            Senders of the coins, or a DataFrame with Sender, Receiver and
+            Value columns.
+        receivers : list or ndarray, optional
+            Receivers of the coins. Not used with a DataFrame.
+        values : list or ndarray, optional
+            Values of the coins transacted. Not used with a DataFrame.
+
+        Returns
+        -------
+        list of str
+            hashes of the transactions.
+
+        '''
+
+        if isinstance(senders, pd.DataFrame):
+            senders, receivers, values = senders['Sender'], senders['Receiver'], senders['Value']
+        senders, receivers, values = (x.tolist() if hasattr(x, 'tolist') else list(x)
+                                      for x in (senders, receivers, values))
+        values = [float(v) for v in values]
+        instruments = self.__instruments
+        if instruments is not None:
+            begin = time.perf_counter()
+        tx_hashes = []
+        start = 0
+        with self.__lock:
+            while start < len(values):
+                if self.__policy.is_full(self.__current_block):
+                    self.__seal_block()
+                row = self.__current_block.get_size()
+                stop = min(start + max(self.__policy.room(self.__current_block), 1), len(values))
+                hashes = self.__current_block.add_transactions(senders[start:stop], receivers[start:stop], values[start:stop])
+                if self.__balances is not None:
+                    balances = self.__balances
+                    for s, r, v in zip(senders[start:stop], receivers[start:stop], values[start:stop]):
+                        balances[s] = balances.get(s, 0.0) - v
+                        balances[r] = balances.get(r, 0.0) + v
+                for tx_hash in hashes:
+                    self.__index_transaction(int.from_bytes(bytes.fromhex(tx_hash)[:8], 'little'), self.__seq_id << 32 | row)
+                    row += 1
+                tx_hashes.extend(hashes)
+                start = stop
+            self.__wake_committer()
+        if instruments is not None:
+            instruments.record('ingest', begin, transactions_added=len(tx_hashes))
+        return tx_hashes
+
+    def __wake_committer(self):
+        '''
+        Seals the current block for the committer thread once it is full, or
+        wakes the committer so it can time the max_age of a new block. Must be
+        called holding the chain lock after adding transactions.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        if self.__committer is None:
+            return
+        if self.__policy.is_full(self.__current_block):
+            self.__seal_block()
+        elif self.__policy.max_age is not None:
+            self.__sealed_changed.notify_all()
+
+    def __index_transaction(self, key, location):
+        '''
+        Records the location of a transaction in the transaction index. Must
+        be called holding the chain lock.
+
+        The index is keyed by the first 8 bytes of the transaction digest read
+        as a little-endian integer and holds (seq_id << 32 | row), 16 bytes
+        per transaction. New entries are appended to growable arrays, which
+        are sorted into a run every INDEX_MERGE_ROWS entries. Runs are kept
+        in geometrically decreasing sizes up to INDEX_RUN_ROWS, so each entry
+        is merged O(log n) times, no merge copies more than INDEX_RUN_ROWS
+        entries and a lookup binary-searches a few runs.
+
+        Parameters
+        ----------
+        key : int
+            truncated digest of the transaction.
+        location : int
+            packed block sequence id and row of the transaction.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        keys, locations = self.__new_index
+        keys.append(key)
+        locations.append(location)
+        if len(keys) >= self.INDEX_MERGE_ROWS:
+            self.__sort_index()
+
+    def __sort_index(self):
+        '''
+        Sorts the new transaction index entries into a run and merges the
+        smallest runs while a run is at least half the size of the one
+        before it and the merged run stays within INDEX_RUN_ROWS. Must be
+        called holding the chain lock.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        new_keys, new_locations = self.__new_index
+        if new_keys:
+            keys = np.frombuffer(new_keys, dtype=np.uint64)
+            order = np.argsort(keys, kind='stable')
+            self.__index_runs.append((keys[order], np.frombuffer(new_locations, dtype=np.int64)[order]))
+            del keys
+            self.__new_index = (array.array('Q'), array.array('q'))
+        runs = self.__index_runs
+        while len(runs) > 1 and 2 * runs[-1][0].size >= runs[-2][0].size \
+                and runs[-1][0].size + runs[-2][0].size <= self.INDEX_RUN_ROWS:
+            right = runs.pop()
+            runs[-1] = merge_runs(runs[-1], right)
+
+    def __merge_index(self):
+        '''
+        Merges the whole transaction index into one sorted run. Must be
+        called holding the chain lock.
+
+        Returns
+        -------
+        tuple
+            sorted keys and their locations.
+
+        '''
+
+        self.__sort_index()
+        runs = self.__index_runs
+        while len(runs) > 1:
+            right = runs.pop()
+            runs[-1] = merge_runs(runs[-1], right)
+        return runs[0] if runs else (np.array([], dtype=np.uint64), np.array([], dtype=np.int64))
+
+    def __index_block(self, block, start=0):
+        '''
+        Records the location of the transactions of a block in the
+        transaction index. Must be called holding the chain lock.
+
+        Parameters
+        ----------
+        block : Block
+            block to index.
+        start : int, optional
+            first row to index. The default is 0.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        seq_id = block.get_header()['seq_id']
+        keys = np.ascontiguousarray(block.get_columns()[5][start:, :8]).view('<u8').ravel()
+        new_keys, new_locations = self.__new_index
+        new_keys.frombytes(keys.tobytes())
+        new_locations.frombytes((seq_id << 32 | np.arange(start, start + keys.size, dtype=np.int64)).tobytes())
+        if len(new_keys) >= self.INDEX_MERGE_ROWS:
+            self.__sort_index()
+
+    def __locate_transaction(self, digest):
+        '''
+        Looks up a transaction in the transaction index
+
+        Parameters
+        ----------
+        digest : bytes
+            binary hash of the transaction.
+
+        Returns
+        -------
+        tuple
+            (block, row) holding the transaction, or None if it is unknown.
+
+        '''
+
+        key = np.uint64(int.from_bytes(digest[:8], 'little'))
+        with self.__lock:
+            if self.__unindexed_blocks:
+                for seq_id in range(self.__unindexed_blocks):
+                    self.__index_block(self.__chain[seq_id])
+                self.__unindexed_blocks = 0
+            found = []
+            for keys, locations in self.__index_runs:
+                start = np.searchsorted(keys, key)
+                stop = np.searchsorted(keys, key, 'right')
+                found += locations[start:stop].tolist()
+            new_keys, new_locations = self.__new_index
+            if new_keys:
+                rows = np.flatnonzero(np.frombuffer(new_keys, dtype=np.uint64) == key).tolist()
+                found += [new_locations[row] for row in rows]
+        for location in found:
+            block = self.__get_block(location >> 32)
+            row = location & 0xFFFFFFFF
+            if block.get_tx_digest(row) == digest:
+                return block, row
+        return None
+
+    def __get_block(self, seq_id):
+        '''
+        Returns a block by sequence id
+
+        Parameters
+        ----------
+        seq_id : int
+            sequence id of the block.
+
+        Returns
+        -------
+        Block
+            committed block, or the current block.
+
+        '''
+
+        with self.__lock:
+            if seq_id < len(self.__chain):
+                return self.__chain[seq_id]
+            for block in self.__sealed:
+                if block.get_header()['seq_id'] == seq_id:
+                    return block
+            return self.__current_block
+
+    def __blocks(self):
+        '''
+        Iterates over the committed blocks, the sealed blocks waiting for the
+        committer and the current block
+
+        Returns
+        -------
+        generator
+            blocks in sequence order.
+
+        '''
+
+        with self.__lock:
+            committed = len(self.__chain)
+            open_blocks = list(self.__sealed) + [self.__current_block]
+        for seq_id in range(committed):
+            yield self.__chain[seq_id]
+        for block in open_blocks:
+            yield block
+
+    def get_transaction(self, tx_hash):
+        '''
+        Returns a transaction by its hash
+
+        Parameters
+        ----------
+        tx_hash : str
+            hash of the transaction.
+
+        Returns
+        -------
+        dict
+            Timestamp, Sender, Receiver, Value and TxHash of the transaction
+            and the SeqId of its block, or None if it is not in the chain.
+
+        '''
+
+        found = self.__locate_transaction(bytes.fromhex(tx_hash))
+        if found is None:
+            return None
+        block, row = found
+        transaction = block.get_transaction(row)
+        transaction['SeqId'] = block.get_header()['seq_id']
+        return transaction
+    
+    def __seal_block(self):
+        '''
+        Seals the current block and opens a new one. Without a committer
+        thread the sealed block is committed right away, otherwise it is
+        queued for the committer. Must be called holding the chain lock.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        block = self.__current_block
+        self.__seq_id += 1
+        if self.__committer is None:
+            self.__commit_block(block)
+            self.__current_block = Block(self.__seq_id, self.__prev_hash, min(self.__policy.max_transactions, 4096),
+                                         self.__parties, self.__instruments)
+        else:
+            self.__current_block = Block(self.__seq_id, None, min(self.__policy.max_transactions, 4096),
+                                         self.__parties, self.__instruments)
+            self.__sealed.append(block)
+            self.__sealed_changed.notify_all()
+
+    def __run_committer(self):
+        '''
+        Body of the committer thread: commits sealed blocks in order and seals
+        the current block when it reaches the max_age of the policy
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        while True:
+            with self.__lock:
+                while not self.__sealed:
+                    if self.__policy.is_full(self.__current_block):
+                        self.__seal_block()
+                        break
+                    if not self.__running:
+                        return
+                    self.__sealed_changed.wait(self.__policy.expires_in(self.__current_block))
+                block = self.__sealed[0]
+            begin = self.__mine_block(block)
+            location = self.__store_block(block)
+            with self.__lock:
+                self.__publish_block(block, location)
+                self.__sealed.popleft()
+                following = self.__sealed[0] if self.__sealed else self.__current_block
+                following.set_prev_hash(self.__prev_hash)
+                self.__sealed_changed.notify_all()
+            self.__announce_block(block, begin)
+
+    def __commit_block(self,block): 
+        '''
+        Commits a sealed block to the chain. Must be called holding the chain
+        lock.
+
+        Parameters
+        ----------
+        block : Block
+            Sealed block to be committed to the chain.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        begin = self.__mine_block(block)
+        self.__publish_block(block)
+        self.__announce_block(block, begin)
+
+    def __mine_block(self, block):
+        '''
+        Finds the nonce and hash of a sealed block and marks it committed.
+        Only reads chain state the committer owns, so the background
+        committer runs it without the chain lock.
+
+        Parameters
+        ----------
+        block : Block
+            Sealed block to be committed to the chain.
+
+        Returns
+        -------
+        float
+            time.perf_counter() when the commit started, or None without
+            instruments.
+
+        '''
+
+        instruments = self.__instruments
+        begin = None
+        if instruments is not None:
+            begin = time.perf_counter()
+        ts = dt.datetime.now()
+        seq_id = block.get_header()['seq_id']
+        merkle_hash = block.get_simple_merkle_root()
+        prefix = encode_block_prefix(self.__prev_hash, self.__id, to_ns(ts), seq_id)
+        if self.__difficulty > 0:
+            start = time.perf_counter()
+            miner = self.__miner or NonceMiner(1)
+            nonce, tried = miner.mine(prefix, hash_bytes(merkle_hash), self.__difficulty)
+            stats = self.__mining_stats.setdefault(self.__difficulty, [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += tried
+            stats[2] += time.perf_counter() - start
+            if instruments is not None:
+                instruments.record('mining', start)
+        else:
+            nonce = np.random.randint(100)
+        block_hash = hash_block(prefix, int(nonce), merkle_hash)
+        block.set_prev_hash(self.__prev_hash)
+        block.set_block_hash(block_hash)
+        block.set_commit_info(to_ns(ts), int(nonce))
+        block.set_status('COMMITTED')
+        return begin
+
+    def __store_block(self, block):
+        '''
+        Writes a committed block to the segment store of a persistent chain,
+        fsync included, without publishing it. Only reads state the committer
+        owns, so the background committer runs it without the chain lock.
+
+        Parameters
+        ----------
+        block : Block
+            committed block.
+
+        Returns
+        -------
+        tuple
+            location for SegmentStore.publish, or None for other chains.
+
+        '''
+
+        if not isinstance(self.__chain, SegmentStore):
+            return None
+        instruments = self.__instruments
+        if instruments is not None:
+            start = time.perf_counter()
+        location = self.__chain.write(block)
+        if instruments is not None:
+            instruments.record('storage', start, bytes_stored=block.get_nbytes())
+        return location
+
+    def __publish_block(self, block, location=None):
+        '''
+        Appends a committed block to the chain and to the derived block
+        structures. Must be called holding the chain lock, so that readers
+        never see the block both in the chain and among the sealed blocks.
+
+        Parameters
+        ----------
+        block : Block
+            committed block.
+        location : tuple, optional
+            location returned by __store_block if the block was already
+            written. The default is None, which stores it now.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        if location is not None:
+            self.__chain.publish(location)
+        else:
+            instruments = self.__instruments
+            if instruments is not None:
+                start = time.perf_counter()
+            self.__chain.append(block)
+            if instruments is not None:
+                instruments.record('storage', start, bytes_stored=block.get_nbytes())
+        self.__prev_hash = block.get_header()['block_hash']
+        if len(self.__block_max_ts) == len(self.__chain) - 1:
+            self.__summarize_block(block)
+        if len(self.__blooms) == len(self.__chain) - 1:
+            self.__extend_blooms()
+
+    def __announce_block(self, block, begin):
+        '''
+        Calls the commit listeners for a published block
+
+        Parameters
+        ----------
+        block : Block
+            committed block.
+        begin : float
+            value returned by __mine_block.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        instruments = self.__instruments
+        for listener in self.__commit_listeners:
+            listener(block)
+        if instruments is None:
+            print('Block committed')
+        else:
+            start = time.perf_counter()
+            print('Block committed')
+            instruments.record('output', start)
+            instruments.record('commit', begin, blocks_committed=1)
+
+    def __summarize_block(self, block):
+        '''
+        Records the first and last transaction time of a committed block in
+        the block summary arrays. __block_max_ts holds the running maximum so
+        it stays sorted; __block_min_ts is sorted as long as the clock never
+        goes backwards, which __ts_ordered tracks.
+
+        Parameters
+        ----------
+        block : Block
+            committed block.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        timestamps = block.get_columns()[1]
+        low = int(timestamps.min()) if timestamps.size else (self.__block_max_ts[-1] if self.__block_max_ts else 0)
+        high = int(timestamps.max()) if timestamps.size else low
+        if self.__block_max_ts:
+            self.__ts_ordered = self.__ts_ordered and low >= self.__block_min_ts[-1]
+            high = max(high, self.__block_max_ts[-1])
+        self.__block_min_ts.append(low)
+        self.__block_max_ts.append(high)
+
+    def query_range(self, t0, t1, as_frame=True):
+        '''
+        Returns the transactions with t0 <= Timestamp < t1. Committed blocks
+        are found by binary search over the block summaries, so only blocks
+        overlapping the range are read.
+
+        Parameters
+        ----------
+        t0 : datetime, Timestamp, datetime64 or str
+            start of the range, inclusive.
+        t1 : datetime, Timestamp, datetime64 or str
+            end of the range, exclusive.
+        as_frame : bool, optional
+            return a DataFrame rather than a dict of arrays. The default is
+            True.
+
+        Returns
+        -------
+        DataFrame or dict
+            Timestamp, Sender, Receiver, Value, TxHash and SeqId of the
+            matching transactions in chain order.
+
+        '''
+
+        t0, t1 = pd.Timestamp(t0).value, pd.Timestamp(t1).value
+        with self.__lock:
+            while len(self.__block_max_ts) < len(self.__chain):
+                self.__summarize_block(self.__chain[len(self.__block_max_ts)])
+            committed = len(self.__block_max_ts)
+            open_blocks = list(self.__sealed) + [self.__current_block]
+            lo = bisect.bisect_left(self.__block_max_ts, t0)
+            hi = bisect.bisect_left(self.__block_min_ts, t1, lo) if self.__ts_ordered else committed
+        candidates = [self.__chain[seq_id] for seq_id in range(lo, hi)] + open_blocks
+        parts = []
+        for block in candidates:
+            timestamps = block.get_columns()[1]
+            rows = np.flatnonzero((timestamps >= t0) & (timestamps < t1))
+            if rows.size:
+                parts.append(block.get_rows(rows))
+        columns = ['Timestamp','Sender','Receiver','Value','TxHash','SeqId']
+        result = {column: np.concatenate([part[column] for part in parts]) if parts else
+                  np.array([], dtype=Block.EMPTY_DTYPES[column]) for column in columns}
+        return pd.DataFrame(result, columns=columns) if as_frame else result
+
+    def __party_hash_arrays(self):
+        '''
+        Returns the filter hashes of every party code, hashing the parties
+        interned since the last call
+
+        Returns
+        -------
+        tuple
+            (h1, h2) uint64 arrays indexed by party code.
+
+        '''
+
+        h1, h2 = self.__party_hashes
+        for code in range(len(h1), len(self.__parties)):
+            first, second = BloomFilter.key_hashes(self.__parties.get_encoded(code))
+            h1.append(first)
+            h2.append(second)
+        return np.frombuffer(h1, dtype=np.uint64), np.frombuffer(h2, dtype=np.uint64)
+
+    def __extend_blooms(self):
+        '''
+        Builds the participant filters of the committed blocks that have none
+        yet
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        with self.__lock:
+            while len(self.__blooms) < len(self.__chain):
+                block = self.__chain[len(self.__blooms)]
+                _, _, senders, receivers, _, _ = block.get_columns()
+                size = block.get_size()
+                codes = np.unique(np.concatenate([senders[:size], receivers[:size]]))
+                h1, h2 = self.__party_hash_arrays()
+                bloom = BloomFilter(len(codes), self.__bloom_fp_rate)
+                bloom.add(h1[codes], h2[codes])
+                self.__blooms.append(bloom)
+
+    def set_bloom_fp_rate(self, fp_rate):
+        '''
+        Changes the false positive rate of the participant filters. Existing
+        filters are dropped and rebuilt at the new rate on the next query.
+
+        Parameters
+        ----------
+        fp_rate : float
+            false positive rate per block.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        with self.__lock:
+            self.__bloom_fp_rate = fp_rate
+            self.__blooms = []
+
+    def bloom_stats(self):
+        '''
+        Returns the size and effectiveness of the participant filters
+
+        Returns
+        -------
+        dict
+            filtered blocks, filter bytes, false positive rate, and the
+            queries, blocks opened and blocks opened without a match
+            (false positives) so far.
+
+        '''
+
+        blooms = list(self.__blooms)
+        queries, opened, false_positives = self.__bloom_queries
+        return {'blocks': len(blooms), 'bytes': sum(bloom.get_nbytes() for bloom in blooms),
+                'fp_rate': self.__bloom_fp_rate, 'queries': queries, 'blocks_opened': opened,
+                'false_positives': false_positives}
+
+    def transactions_for(self, party, as_frame=True):
+        '''
+        Returns the transactions a party sent or received. Only committed
+        blocks whose participant filter may hold the party are read.
+
+        Parameters
+        ----------
+        party : str
+            sender or receiver.
+        as_frame : bool, optional
+            return a DataFrame rather than a dict of arrays. The default is
+            True.
+
+        Returns
+        -------
+        DataFrame or dict
+            Timestamp, Sender, Receiver, Value, TxHash and SeqId of the
+            matching transactions in chain order.
+
+        '''
+
+        code = self.__parties.get_code(party)
+        parts = []
+        if code is not None:
+            with self.__lock:
+                self.__extend_blooms()
+                blooms = list(self.__blooms)
+                open_blocks = list(self.__sealed) + [self.__current_block]
+            h1, h2 = (int(h[code]) for h in self.__party_hash_arrays())
+            candidates = [self.__chain[seq_id] for seq_id, bloom in enumerate(blooms) if bloom.might_contain(h1, h2)]
+            opened = len(candidates)
+            candidates += open_blocks
+            misses = 0
+            for i, block in enumerate(candidates):
+                _, _, senders, receivers, _, _ = block.get_columns()
+                size = block.get_size()
+                rows = np.flatnonzero((senders[:size] == code) | (receivers[:size] == code))
+                if rows.size:
+                    parts.append(block.get_rows(rows))
+                elif i < opened:
+                    misses += 1
+            self.__bloom_queries[0] += 1
+            self.__bloom_queries[1] += opened
+            self.__bloom_queries[2] += misses
+        columns = ['Timestamp','Sender','Receiver','Value','TxHash','SeqId']
+        result = {column: np.concatenate([part[column] for part in parts]) if parts else
+                  np.array([], dtype=Block.EMPTY_DTYPES[column]) for column in columns}
+        return pd.DataFrame(result, columns=columns) if as_frame else result
+
+    def set_difficulty(self, difficulty):
+        '''
+        Sets the proof of work difficulty of the following commits, starting
+        the mining workers from the calling thread the first time it is above
+        0
+
+        Parameters
+        ----------
+        difficulty : int
+            number of leading zero bits a block hash needs, 0 to disable
+            proof of work.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        if difficulty > 0 and self.__miner is None:
+            self.__miner = NonceMiner(self.__mining_processes)
+        self.__difficulty = difficulty
+
+    def mining_stats(self):
+        '''
+        Returns the proof of work statistics for each difficulty mined
+
+        Returns
+        -------
+        dict
+            blocks, hashes, seconds, hashes_per_second and seconds_per_block
+            by difficulty.
+
+        '''
+
+        return {difficulty: {'blocks': blocks, 'hashes': hashes, 'seconds': seconds,
+                             'hashes_per_second': hashes / seconds if seconds else 0.0,
+                             'seconds_per_block': seconds / blocks}
+                for difficulty, (blocks, hashes, seconds) in self.__mining_stats.items()}
+
+    def add_commit_listener(self, listener):
+        '''
+        Registers a function called with every block once it is committed.
+        It runs on the thread that committed the block.
+
+        Parameters
+        ----------
+        listener : callable
+            function taking the committed Block.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__commit_listeners.append(listener)
+
+    def remove_commit_listener(self, listener):
+        '''
+        Unregisters a function added with add_commit_listener
+
+        Parameters
+        ----------
+        listener : callable
+            function to remove.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__commit_listeners.remove(listener)
+    
+    def checkpoint(self, path):
+        '''
+        Writes a binary snapshot of the chain state to path: the chain header,
+        the party dictionary, the current block and the derived structures
+        (transaction index, balances and block time summaries). An in-memory
+        chain also snapshots its committed blocks, since nothing else holds
+        them. Sealed blocks are committed first.
+
+        Parameters
+        ----------
+        path : str
+            file to write; an .npz archive.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        with self.__lock:
+            while self.__committer is not None and self.__sealed:
+                self.__sealed_changed.wait()
+            in_memory = not isinstance(self.__chain, SegmentStore)
+            blocks = (list(self.__chain) if in_memory else []) + [self.__current_block]
+            keys, locations = self.__merge_index()
+            balances = self.__balances
+            meta = {'name': self.__name, 'id': self.__id, 'committed': len(self.__chain), 'prev_hash': self.__prev_hash,
+                    'unindexed_blocks': self.__unindexed_blocks, 'ts_ordered': self.__ts_ordered,
+                    'has_balances': balances is not None, 'parties': self.__parties.get_names(),
+                    'headers': [block.get_header() for block in blocks]}
+            columns = [block.get_columns()[1:] for block in blocks]
+            arrays = {name: np.concatenate([column[i] for column in columns])
+                      for i, name in enumerate(['timestamps', 'senders', 'receivers', 'values', 'digests'])}
+            with open(path, 'wb') as f:
+                np.savez(f, meta=np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8),
+                         index_keys=keys, index_locations=locations,
+                         balance_names=np.array(list(balances) if balances else [], dtype=str),
+                         balance_values=np.array(list(balances.values()) if balances else [], dtype=np.float64),
+                         block_min_ts=np.frombuffer(self.__block_min_ts, dtype=np.int64) if self.__block_min_ts else np.array([], dtype=np.int64),
+                         block_max_ts=np.frombuffer(self.__block_max_ts, dtype=np.int64) if self.__block_max_ts else np.array([], dtype=np.int64),
+                         **arrays)
+
+    @classmethod
+    def restore(cls, path, store=None, **kwargs):
+        '''
+        Recreates a chain from a checkpoint. With a segment store only the
+        blocks committed after the checkpoint are replayed into the derived
+        structures, so restart time does not grow with the history.
+
+        Parameters
+        ----------
+        path : str
+            checkpoint written by checkpoint.
+        store : str, optional
+            segment store directory of a persistent chain. The default is
+            None, for a checkpoint of an in-memory chain.
+        **kwargs
+            other PandasChain constructor arguments.
+
+        Returns
+        -------
+        PandasChain
+            the restored chain.
+
+        '''
+
+        with np.load(path, allow_pickle=False) as data:
+            snapshot = {name: data[name] for name in data.files}
+        meta = json.loads(snapshot['meta'].tobytes().decode('utf-8'))
+        chain = cls(meta['name'], store, **kwargs)
+        chain.__load_checkpoint(meta, snapshot)
+        return chain
+
+    def __load_checkpoint(self, meta, snapshot):
+        '''
+        Replaces the state of a newly constructed chain with a checkpoint and
+        replays the stored blocks committed after it
+
+        Parameters
+        ----------
+        meta : dict
+            chain header of the checkpoint.
+        snapshot : dict
+            arrays of the checkpoint.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        in_memory = not isinstance(self.__chain, SegmentStore)
+        if not in_memory and self.__id != meta['id']:
+            raise ValueError('Checkpoint of chain ' + meta['id'] + ' does not match store of chain ' + self.__id)
+        with self.__lock:
+            self.__id = meta['id']
+            for name in meta['parties']:
+                self.__parties.intern(name)
+            blocks = []
+            start = 0
+            for header in meta['headers']:
+                stop = start + header['size']
+                blocks.append(Block.from_columns(header, self.__parties, snapshot['timestamps'][start:stop],
+                                                 snapshot['senders'][start:stop], snapshot['receivers'][start:stop],
+                                                 snapshot['values'][start:stop], snapshot['digests'][start:stop]))
+                start = stop
+            current = blocks.pop()
+            committed = meta['committed']
+            if isinstance(self.__chain, ArchiveStore):
+                for block in blocks:
+                    self.__chain.append(block)
+                self.__prev_hash = meta['prev_hash']
+            elif in_memory:
+                self.__chain = blocks
+                self.__prev_hash = meta['prev_hash']
+            self.__index_runs = [(snapshot['index_keys'], snapshot['index_locations'])]
+            self.__new_index = (array.array('Q'), array.array('q'))
+            self.__merkle_trees.clear()
+            self.__unindexed_blocks = meta['unindexed_blocks']
+            self.__balances = dict(zip(snapshot['balance_names'].tolist(), snapshot['balance_values'].tolist())) \
+                if meta['has_balances'] else None
+            self.__block_min_ts = array.array('q', snapshot['block_min_ts'].tobytes())
+            self.__block_max_ts = array.array('q', snapshot['block_max_ts'].tobytes())
+            self.__ts_ordered = meta['ts_ordered']
+            checkpointed = current.get_header()
+            for seq_id in range(committed, len(self.__chain)):
+                block = self.__chain[seq_id]
+                start = checkpointed['size'] if seq_id == checkpointed['seq_id'] else 0
+                self.__index_block(block, start)
+                if self.__balances is not None:
+                    self.__apply_balances(block, start)
+                if len(self.__block_max_ts) == seq_id:
+                    self.__summarize_block(block)
+            self.__seq_id = len(self.__chain)
+            if current.get_header()['seq_id'] == self.__seq_id:
+                current.set_instruments(self.__instruments)
+                self.__current_block = current
+
+    def __apply_balances(self, block, start=0):
+        '''
+        Adds the transactions of a block to the balance view
+
+        Parameters
+        ----------
+        block : Block
+            block to apply.
+        start : int, optional
+            first row to apply. The default is 0.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        n = len(self.__parties)
+        _, _, senders, receivers, values, _ = block.get_columns()
+        senders, receivers, values = senders[start:], receivers[start:], values[start:]
+        totals = (np.bincount(receivers, weights=values, minlength=n) -
+                  np.bincount(senders, weights=values, minlength=n)).tolist()
+        names = self.__parties.get_names()
+        for code in np.union1d(senders, receivers).tolist():
+            self.__balances[names[code]] = self.__balances.get(names[code], 0.0) + totals[code]
+
+    def export(self, path, format='npz', chunk_rows=1 << 16):
+        '''
+        Exports every transaction and the block metadata (seq_id, block hash,
+        previous hash, merkle root, status and size) to a columnar file. Blocks
+        are read once and streamed in chunks of about chunk_rows
+        transactions, so memory stays bounded however long the chain is; the
+        block metadata is read from the headers, so archived blocks are not
+        rehydrated for it.
+
+        npz writes one archive with the transaction columns timestamp,
+        sender, receiver (codes into parties), value, tx_hash and seq_id, the
+        parties array and the block_* metadata columns. feather and parquet
+        need pyarrow; they write the transactions to path, with
+        dictionary-encoded Sender and Receiver columns, and the block metadata
+        next to it as <name>.blocks<ext>.
+
+        Parameters
+        ----------
+        path : str
+            file to write.
+        format : str, optional
+            'npz', 'feather' or 'parquet'. The default is 'npz'.
+        chunk_rows : int, optional
+            transactions per chunk. The default is 65536.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        if format not in ('npz', 'feather', 'parquet'):
+            raise ValueError('Unknown export format ' + str(format))
+        if format != 'npz' and pa is None:
+            raise ImportError('Exporting to ' + format + ' requires pyarrow')
+        with self.__lock:
+            committed = len(self.__chain)
+            open_blocks = list(self.__sealed) + [self.__current_block]
+            open_sizes = [block.get_size() for block in open_blocks]
+            names = list(self.__parties.get_names())
+
+        archived = isinstance(self.__chain, ArchiveStore)
+
+        def blocks():
+            for seq_id in range(committed):
+                block = self.__chain[seq_id]
+                yield block, block.get_size()
+            for block, size in zip(open_blocks, open_sizes):
+                yield block, size
+
+        def headers():
+            for seq_id in range(committed):
+                yield self.__chain.get_header(seq_id) if archived else self.__chain[seq_id].get_header()
+            for block, size in zip(open_blocks, open_sizes):
+                yield dict(block.get_header(), size=size)
+
+        def chunks(items, rows):
+            parts, n = [], 0
+            for item in items:
+                parts.append(item)
+                n += rows(item)
+                if n >= chunk_rows:
+                    yield parts
+                    parts, n = [], 0
+            if parts:
+                yield parts
+
+        def replay(stream, dtype, width):
+            stream.seek(0)
+            while True:
+                data = stream.read(chunk_rows * width * np.dtype(dtype).itemsize)
+                if not data:
+                    return
+                yield np.frombuffer(data, dtype=dtype)
+
+        def hashes(values):
+            return np.array([value or '' for value in values], dtype='S64')
+
+        tx_columns = [('timestamp', np.int64, 1, 1), ('sender', np.int32, 2, 1), ('receiver', np.int32, 3, 1),
+                      ('value', np.float64, 4, 1), ('tx_hash', np.uint8, 5, 32), ('seq_id', np.int64, None, 1)]
+        block_columns = [('seq_id', np.int64, np.array), ('block_hash', 'S64', hashes),
+                         ('prev_hash', 'S64', hashes), ('merkle_root', 'S64', hashes),
+                         ('status', 'S11', lambda values: np.array(values, dtype='S11')),
+                         ('size', np.int64, np.array)]
+        if format == 'npz':
+            n_blocks = committed + len(open_blocks)
+            with contextlib.ExitStack() as stack:
+                streams = [stack.enter_context(tempfile.TemporaryFile()) for _ in tx_columns]
+                total = 0
+                for block, size in blocks():
+                    columns = block.get_columns()
+                    for stream, (_, dtype, index, _) in zip(streams, tx_columns):
+                        data = np.full(size, block.get_header()['seq_id']) if index is None else columns[index][:size]
+                        stream.write(np.ascontiguousarray(data, dtype=dtype).tobytes())
+                    total += size
+                archive = stack.enter_context(zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED, allowZip64=True))
+                for stream, (name, dtype, _, width) in zip(streams, tx_columns):
+                    write_npy_stream(archive, name, dtype, (total, width) if width > 1 else (total,),
+                                     replay(stream, dtype, width))
+                write_npy_stream(archive, 'parties', np.array(names, dtype=str).dtype if names else '<U1',
+                                 (len(names),), [np.array(names, dtype=str)])
+                for name, dtype, convert in block_columns:
+                    write_npy_stream(archive, 'block_' + name, dtype, (n_blocks,),
+                                     (convert([header[name] for header in parts])
+                                      for parts in chunks(headers(), lambda header: 1)))
+            return
+
+        dictionary = pa.array(names, pa.string())
+        tx_fields = [('Timestamp', pa.timestamp('ns')), ('Sender', pa.dictionary(pa.int32(), pa.string())),
+                     ('Receiver', pa.dictionary(pa.int32(), pa.string())), ('Value', pa.float64()),
+                     ('TxHash', pa.binary(32)), ('SeqId', pa.int64())]
+        block_fields = [('SeqId', pa.int64()), ('BlockHash', pa.string()), ('PrevHash', pa.string()),
+                        ('MerkleRoot', pa.string()), ('Status', pa.string()), ('Size', pa.int64())]
+        root, ext = os.path.splitext(path)
+        for target, fields, batches in [
+                (path, tx_fields,
+                 ([pa.array(np.concatenate([p[0] for p in parts]).view('datetime64[ns]')),
+                   pa.DictionaryArray.from_arrays(pa.array(np.concatenate([p[1] for p in parts])), dictionary),
+                   pa.DictionaryArray.from_arrays(pa.array(np.concatenate([p[2] for p in parts])), dictionary),
+                   pa.array(np.concatenate([p[3] for p in parts])),
+                   pa.FixedSizeBinaryArray.from_buffers(pa.binary(32), sum(len(p[3]) for p in parts),
+                                                        [None, pa.py_buffer(np.concatenate([p[4] for p in parts]).tobytes())]),
+                   pa.array(np.concatenate([np.full(len(p[3]), p[5]) for p in parts]))]
+                  for parts in chunks((tuple(c[:size] for c in block.get_columns()[1:]) + (block.get_header()['seq_id'],)
+                                       for block, size in blocks()), lambda part: len(part[3])))),
+                (root + '.blocks' + ext, block_fields,
+                 ([pa.array([h['seq_id'] for h in parts], pa.int64())] +
+                  [pa.array([h[key] for h in parts], pa.string()) for key in ('block_hash', 'prev_hash', 'merkle_root', 'status')] +
+                  [pa.array([h['size'] for h in parts], pa.int64())]
+                  for parts in chunks(headers(), lambda header: 1)))]:
+            schema = pa.schema(fields)
+            writer = pq.ParquetWriter(target, schema) if format == 'parquet' else pa.ipc.new_file(target, schema)
+            with writer:
+                for arrays in batches:
+                    writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+
+    def __compute_balances(self):
+        '''
+        Computes the balance of every party from the blocks of the chain
+
+        Returns
+        -------
+        dict
+            balance by party.
+
+        '''
+
+        n = len(self.__parties)
+        totals = np.zeros(n)
+        counts = np.zeros(n, dtype=np.int64)
+        for block in self.__blocks():
+            _, _, senders, receivers, values, _ = block.get_columns()
+            totals += np.bincount(receivers, weights=values, minlength=n) - np.bincount(senders, weights=values, minlength=n)
+            counts += np.bincount(senders, minlength=n) + np.bincount(receivers, minlength=n)
+        names = self.__parties.get_names()
+        return {names[code]: totals[code] for code in np.flatnonzero(counts).tolist()}
+
+    def rebuild_balances(self):
+        '''
+        Rebuilds the balance view from the blocks of the chain, e.g. after the
+        chain was reopened from its segment store
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        with self.__lock:
+            self.__balances = self.__compute_balances()
+
+    def check_balances(self):
+        '''
+        Checks the balance view against balances recomputed from the blocks
+
+        Returns
+        -------
+        bool
+            True if every balance matches the blocks.
+
+        '''
+
+        with self.__lock:
+            if self.__balances is None:
+                self.__balances = self.__compute_balances()
+                return True
+            expected = self.__compute_balances()
+            return expected.keys() == self.__balances.keys() and \
+                all(math.isclose(expected[party], balance, abs_tol=1e-6) for party, balance in self.__balances.items())
+
+    def get_balance(self, party):
+        '''
+        Returns the balance of a party: coins received minus coins sent
+
+        Parameters
+        ----------
+        party : str
+            name of the party.
+
+        Returns
+        -------
+        float
+            balance of the party, 0 if it never transacted.
+
+        '''
+
+        if self.__balances is None:
+            self.rebuild_balances()
+        return self.__balances.get(party, 0.0)
+
+    def archive_stats(self):
+        '''
+        Returns the tiers and cache counters of an archived chain
+
+        Returns
+        -------
+        dict
+            see ArchiveStore.stats, or None without an ArchivePolicy.
+
+        '''
+
+        return self.__chain.stats() if isinstance(self.__chain, ArchiveStore) else None
+
+    def get_balances(self):
+        '''
+        Returns the balance of every party
+
+        Returns
+        -------
+        dict
+            balance by party.
+
+        '''
+
+        if self.__balances is None:
+            self.rebuild_balances()
+        return dict(self.__balances)
+
+    def top_balances(self, k):
+        '''
+        Returns the parties with the highest balances
+
+        Parameters
+        ----------
+        k : int
+            number of parties to return.
+
+        Returns
+        -------
+        list of tuple
+            (party, balance) pairs, highest balance first.
+
+        '''
+
+        if self.__balances is None:
+            self.rebuild_balances()
+        return heapq.nlargest(k, self.__balances.items(), key=lambda item: item[1])
+
+    def validate(self, processes=None):
+        '''
+        Validates the committed blocks of the chain. The merkle root of every
+        block is re-derived from its transaction hashes and every prev_hash
+        is checked against the hash of the block before it. Contiguous ranges
+        of blocks are hashed in a process pool and the links between the
+        ranges are checked afterwards. Workers read their blocks themselves:
+        a persistent chain's workers map the segment files, and an in-memory
+        chain copies its transaction hashes once into shared memory, so only
+        block locations and headers are sent to them.
+
+        Parameters
+        ----------
+        processes : int, optional
+            number of worker processes, 1 to validate in this process. The
+            default is None, which uses every CPU.
+
+        Returns
+        -------
+        int
+            sequence id of the first corrupt block, or None if the chain is
+            valid.
+
+        '''
+
+        n = len(self.__chain)
+        processes = processes or os.cpu_count() or 1
+        bounds = np.linspace(0, n, min(processes * 4, n) + 1).astype(int).tolist() if n else [0]
+        ranges = list(zip(bounds, bounds[1:]))
+
+        def blocks(start, stop):
+            for seq_id in range(start, stop):
+                block = self.__chain[seq_id]
+                header = block.get_header()
+                yield (seq_id, header['prev_hash'], header['block_hash'], header['merkle_root'],
+                       block.get_columns()[5][:block.get_size()])
+
+        shm = None
+        try:
+            if processes == 1 or len(ranges) < 2:
+                results = [validate_blocks(blocks(start, stop)) for start, stop in ranges]
+            else:
+                if isinstance(self.__chain, SegmentStore):
+                    jobs = [(read_segment_blocks, (self.__chain.get_locations(start, stop),)) for start, stop in ranges]
+                else:
+                    headers, rows = [], 0
+                    for seq_id in range(n):
+                        header = self.__chain[seq_id].get_header()
+                        headers.append((seq_id, header['prev_hash'], header['block_hash'], header['merkle_root'],
+                                        rows, header['size']))
+                        rows += header['size']
+                    shm = multiprocessing.shared_memory.SharedMemory(create=True, size=max(32 * rows, 1))
+                    digests = np.ndarray((rows, 32), dtype=np.uint8, buffer=shm.buf)
+                    for seq_id, _, _, _, start, size in headers:
+                        digests[start:start + size] = self.__chain[seq_id].get_columns()[5][:size]
+                    del digests
+                    jobs = [(read_shared_blocks, (shm.name, headers[start:stop])) for start, stop in ranges]
+                with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+                    results = list(executor.map(validate_range, *zip(*jobs)))
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        corrupt = [seq_id for seq_id, _, _ in results if seq_id is not None]
+        if results and results[0][1] is not None:
+            corrupt.append(0)
+        for (start, _), previous, result in zip(ranges[1:], results, results[1:]):
+            if previous[0] is None and result[1] != previous[2]:
+                corrupt.append(start)
+        return min(corrupt) if corrupt else None
+
+    def display_block_headers(self, start=None, stop=None, tail=None, format='text', file=None): 
+        '''
+        Displays the metadata for each block through a buffered ChainRenderer
+
+        Parameters
+        ----------
+        start : int, optional
+            first seq_id to display. The default is None, the first block.
+        stop : int, optional
+            seq_id to stop before. The default is None, after the last block.
+        tail : int, optional
+            display only the last tail blocks of the selection. The default is
+            None.
+        format : str, optional
+            'text', 'csv' or 'binary', see ChainRenderer. The default is 'text'.
+        file : file, optional
+            stream to write to. The default is None, which writes to stdout.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        with ChainRenderer(file, format) as renderer:
+            for block in self.__select_blocks(start, stop, tail, headers=True):
+                renderer.write_header(block)
+    
+    def get_chain_id(self):
+        '''
+        Returns the ID of the chain
+
+        Returns
+        -------
+        str
+            ID of the chain.
+
+        '''
+
+        return self.__id
+
+    def get_committed_count(self):
+        '''
+        Returns the number of committed blocks
+
+        Returns
+        -------
+        int
+            number of committed blocks.
+
+        '''
+
+        with self.__lock:
+            return len(self.__chain)
+
+    def get_committed(self, seq_id):
+        '''
+        Returns a committed block
+
+        Parameters
+        ----------
+        seq_id : int
+            sequence id of the block.
+
+        Returns
+        -------
+        Block
+            the block, or None if it is not committed yet.
+
+        '''
+
+        with self.__lock:
+            return self.__chain[seq_id] if seq_id < len(self.__chain) else None
+
+    def apply_block(self, data, chain_id=None):
+        '''
+        Appends a block committed by another chain, e.g. a primary this chain
+        replicates. The block must be the next one in sequence and its
+        prev_hash must be the hash of the last block; a chain applying blocks
+        cannot take transactions of its own.
+
+        Parameters
+        ----------
+        data : bytes
+            block encoded by encode_block.
+        chain_id : str, optional
+            ID of the chain that committed the block. When given the block
+            hash is recomputed and checked. The default is None.
+
+        Returns
+        -------
+        Block
+            the applied block.
+
+        '''
+
+        with self.__lock:
+            if self.__current_block.get_size() or self.__sealed:
+                raise ValueError('Cannot apply blocks to a chain with transactions of its own')
+            block = decode_block(data, self.__parties)
+            header = block.get_header()
+            if header['status'] != 'COMMITTED' or header['seq_id'] != self.__seq_id:
+                raise ValueError('Expected committed block ' + str(self.__seq_id) + ', got ' + str(header['seq_id']))
+            if header['prev_hash'] != self.__prev_hash:
+                raise ValueError('Block ' + str(header['seq_id']) + ' does not continue the chain')
+            if chain_id is not None and header['block_hash'] != hash_block(
+                    encode_block_prefix(header['prev_hash'], chain_id, header['commit_ts'], header['seq_id']),
+                    header['nonce'], header['merkle_root']):
+                raise ValueError('Block ' + str(header['seq_id']) + ' does not match its block hash')
+            self.__chain.append(block)
+            self.__prev_hash = header['block_hash']
+            self.__seq_id += 1
+            self.__index_block(block)
+            if self.__balances is not None:
+                self.__apply_balances(block)
+            if len(self.__block_max_ts) == len(self.__chain) - 1:
+                self.__summarize_block(block)
+            if len(self.__blooms) == len(self.__chain) - 1:
+                self.__extend_blooms()
+            self.__current_block = Block(self.__seq_id, self.__prev_hash, min(self.__policy.max_transactions, 4096),
+                                         self.__parties, self.__instruments)
+            for listener in self.__commit_listeners:
+                listener(block)
+        return block
+
+    def get_number_of_blocks(self): 
+        '''
+        Returns the number of blocks in the chain
+
+        Returns
+        -------
+        int
+            Number of blocks in the chain.
+
+        '''
+
+        with self.__lock:
+            return len(self.__chain) + len(self.__sealed) + 1
+    
+    def get_values(self, timestamps=False):
+        '''
+        Returns the coin values of every transaction in the chain
+
+        Parameters
+        ----------
+        timestamps : bool, optional
+            also return the timestamp of every transaction. The default is
+            False.
+
+        Returns
+        -------
+        ndarray
+            float64 array of coin values transacted, followed by a
+            datetime64[ns] array of their timestamps if timestamps is True.
+
+        '''
+        
+        blocks = list(self.__blocks())
+        values = np.concatenate([block.get_values() for block in blocks])
+        if not timestamps:
+            return values
+        return values, np.concatenate([block.get_timestamps() for block in blocks])
+
+    def iter_values(self, timestamps=False):
+        '''
+        Yields the coin values of the chain one block at a time, for charting
+        chains that do not fit in memory
+
+        Parameters
+        ----------
+        timestamps : bool, optional
+            also yield the timestamps of the transactions. The default is
+            False.
+
+        Yields
+        ------
+        ndarray
+            float64 array of the coin values of a block, or a (values,
+            datetime64[ns] timestamps) tuple if timestamps is True.
+
+        '''
+
+        for block in self.__blocks():
+            if timestamps:
+                yield block.get_values(), block.get_timestamps()
+            else:
+                yield block.get_values()
+
+    def get_proof(self, tx_hash):
+        '''
+        Returns a merkle inclusion proof for a transaction in a committed
+        block. The merkle trees of the last PROOF_CACHE_BLOCKS blocks proven
+        are cached, so each further proof costs O(log n).
+
+        Parameters
+        ----------
+        tx_hash : str
+            hash of the transaction.
+
+        Returns
+        -------
+        dict
+            transaction hash, its position in the block, the sibling hashes
+            from the transaction up to the merkle root and the block header,
+            or None if the transaction is not in a committed block.
+
+        '''
+
+        found = self.__locate_transaction(bytes.fromhex(tx_hash))
+        if found is None or found[0].get_header()['status'] != 'COMMITTED':
+            return None
+        block, index = found
+        header = block.get_header()
+        with self.__lock:
+            tree = self.__merkle_trees.get(header['seq_id'])
+            if tree is not None:
+                self.__merkle_trees.move_to_end(header['seq_id'])
+        if tree is None:
+            tree = merkle_tree(block.get_tx_digests())
+            with self.__lock:
+                self.__merkle_trees[header['seq_id']] = tree
+                while len(self.__merkle_trees) > self.PROOF_CACHE_BLOCKS:
+                    self.__merkle_trees.popitem(last=False)
+        return {'tx_hash': tx_hash, 'index': index,
+                'path': [h.hex() for h in merkle_proof(None, index, tree)],
+                'header': header}
+
+class PartyDictionary:
+    '''
+    Class interning party names into int32 codes, shared by every block of a
+    chain so that blocks store codes rather than strings
+    '''
+
+    def __init__(self):
+        '''
+        Constructor of the PartyDictionary class.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__names = []
+        self.__codes = {}
+        self.__encoded = []
+        self.__decoder = np.array([], dtype=object)
+
+    def intern(self, name):
+        '''
+        Returns the code of a party, assigning the next code to a new party
+
+        Parameters
+        ----------
+        name : str
+            name of the party.
+
+        Returns
+        -------
+        int
+            code of the party.
+
+        '''
+
+        code = self.__codes.get(name)
+        if code is None:
+            code = len(self.__names)
+            self.__encoded.append(encode_name(name))
+            self.__codes[name] = code
+            self.__names.append(name)
+        return code
+
+    def get_code(self, name):
+        '''
+        Returns the code of a party without interning it
+
+        Parameters
+        ----------
+        name : str
+            name of the party.
+
+        Returns
+        -------
+        int
+            code of the party, or None if it is unknown.
+
+        '''
+
+        return self.__codes.get(name)
+
+    def get_name(self, code):
+        '''
+        Returns the name of a party code
+
+        Parameters
+        ----------
+        code : int
+            code of the party.
+
+        Returns
+        -------
+        str
+            name of the party.
+
+        '''
+
+        return self.__names[code]
+
+    def get_encoded(self, code):
+        '''
+        Returns the name of a party code as encoded by encode_name, cached
+        so transactions can be hashed without re-encoding names
+
+        Parameters
+        ----------
+        code : int
+            code of the party.
+
+        Returns
+        -------
+        bytes
+            encoded name.
+
+        '''
+
+        return self.__encoded[code]
+
+    def get_names(self):
+        '''
+        Returns the interned names in code order
+
+        Returns
+        -------
+        list of str
+            party names; the list is shared, do not modify it.
+
+        '''
+
+        return self.__names
+
+    def decode(self, codes):
+        '''
+        Decodes an array of party codes into names
+
+        Parameters
+        ----------
+        codes : ndarray
+            party codes.
+
+        Returns
+        -------
+        ndarray
+            object array of party names.
+
+        '''
+
+        if len(self.__decoder) != len(self.__names):
+            self.__decoder = np.array(self.__names, dtype=object)
+        return self.__decoder[codes]
+
+    def __len__(self):
+        return len(self.__names)
+
+class Block:
+    '''
+    Class representing a block of transactions in a blockchain.
+
+    Transactions are kept in preallocated, typed column buffers and the
+    DataFrame view is only built when it is asked for.
+    '''
+
+    TX_BYTES = 56
+    EMPTY_DTYPES = {'Timestamp': 'datetime64[ns]', 'Sender': object, 'Receiver': object, 'Value': np.float64,
+                    'TxHash': object, 'SeqId': np.int64}
+
+    def __init__(self,seq_id,prev_hash,capacity=10,parties=None,instruments=None): 
+        '''
+        Constructor for the Block class
+
+        Parameters
+        ----------
+        seq_id : int
+            Sequence number for the block.
+        prev_hash : str
+            hash of the previous block in the chain.
+        capacity : int, optional
+            Number of transactions to preallocate room for. The default is 10.
+        parties : PartyDictionary, optional
+            Dictionary interning the sender and receiver names. The default is
+            None, which gives the block a dictionary of its own.
+        instruments : Instruments, optional
+            records the time spent hashing and in the merkle tree. The
+            default is None.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__seq_id = seq_id
+        self.__prev_hash = prev_hash
+        self.__col_names = ['Timestamp','Sender','Receiver','Value','TxHash']
+        self.__size = 0
+        self.__allocate(max(int(capacity), 1))
+        self.__parties = parties if parties is not None else PartyDictionary()
+        self.__transactions = None
+        self.__frontier = []
+        self.__status = 'UNCOMMITTED'
+        self.__block_hash = None
+        self.__merkle_tx_hash = None
+        self.__commit_ts = None
+        self.__nonce = None
+        self.__instruments = instruments
+
+    @classmethod
+    def from_columns(cls, header, parties, timestamps, senders, receivers, values, digests):
+        '''
+        Creates a committed block around existing column arrays without
+        copying them, e.g. arrays mapped from a segment file
+
+        Parameters
+        ----------
+        header : dict
+            block metadata as returned by get_header.
+        parties : PartyDictionary
+            dictionary of the sender and receiver codes.
+        timestamps, senders, receivers, values, digests : ndarray
+            transaction columns as returned by get_columns.
+
+        Returns
+        -------
+        Block
+            the committed block.
+
+        '''
+
+        block = cls.__new__(cls)
+        block.__seq_id = header['seq_id']
+        block.__prev_hash = header['prev_hash']
+        block.__col_names = ['Timestamp','Sender','Receiver','Value','TxHash']
+        block.__size = header['size']
+        block.__timestamps = timestamps
+        block.__senders = senders
+        block.__receivers = receivers
+        block.__values = values
+        block.__digests = digests
+        block.__parties = parties
+        block.__transactions = None
+        block.__frontier = []
+        if header['status'] != 'COMMITTED':
+            for row in range(block.__size):
+                merkle_push(block.__frontier, digests[row].tobytes())
+        block.__status = header['status']
+        block.__block_hash = header['block_hash']
+        block.__merkle_tx_hash = header['merkle_root']
+        block.__commit_ts = header['commit_ts']
+        block.__nonce = header['nonce']
+        block.__instruments = None
+        return block
+
+    def __allocate(self, capacity):
+        '''
+        Allocates (or grows) the column buffers to hold capacity transactions
+
+        Parameters
+        ----------
+        capacity : int
+            Number of transactions the buffers must hold.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        n = self.__size
+        timestamps = np.empty(capacity, dtype=np.int64)
+        senders = np.empty(capacity, dtype=np.int32)
+        receivers = np.empty(capacity, dtype=np.int32)
+        values = np.empty(capacity, dtype=np.float64)
+        digests = np.empty((capacity, 32), dtype=np.uint8)
+        if n:
+            timestamps[:n] = self.__timestamps[:n]
+            senders[:n] = self.__senders[:n]
+            receivers[:n] = self.__receivers[:n]
+            values[:n] = self.__values[:n]
+            digests[:n] = self.__digests[:n]
+        self.__timestamps = timestamps
+        self.__senders = senders
+        self.__receivers = receivers
+        self.__values = values
+        self.__digests = digests
+
+    def display_header(self): 
+        '''
+        Displays the metadata for this block
+
+        Returns
+        -------
+        None.
+
+        '''
+        print("{seq_id}, {status}, {block_hash}, {prev_hash}, {merkle}, {trans_count}".format( \
+            seq_id = self.__seq_id, status = self.__status, block_hash = self.__block_hash, \
+            prev_hash = self.__prev_hash, merkle = self.__merkle_tx_hash, trans_count = self.get_size()))
+    
+    def add_transaction(self, s, r, v): 
+        '''
+        Adds a transaction to the block
+
+        Parameters
+        ----------
+        s : str
+            Sender of the coins.
+        r : str
+            Receiver of the coins.
+        v : float
+            Value of the coins transacted.
+
+        Returns
+        -------
+        str
+            hash of the transaction.
+
+        '''
+
+        instruments = self.__instruments
+        ts = reserve_timestamps()
+        sender, receiver, v = self.__parties.intern(s), self.__parties.intern(r), float(v)
+        encoded_sender, encoded_receiver = self.__parties.get_encoded(sender), self.__parties.get_encoded(receiver)
+        if instruments is not None:
+            start = time.perf_counter()
+            digest = update_transaction(hashlib.sha256(), ts, encoded_sender, encoded_receiver, v).digest()
+            instruments.record('hashing', start, bytes_hashed=16 + len(encoded_sender) + len(encoded_receiver))
+        else:
+            digest = update_transaction(hashlib.sha256(), ts, encoded_sender, encoded_receiver, v).digest()
+        tx_hash = digest.hex()
+        n = self.__size
+        if n == self.__values.shape[0]:
+            self.__allocate(max(2 * n, 1))
+        self.__timestamps[n] = ts
+        self.__senders[n] = sender
+        self.__receivers[n] = receiver
+        self.__values[n] = v
+        self.__digests[n] = np.frombuffer(digest, dtype=np.uint8)
+        self.__size = n + 1
+        self.__transactions = None
+        if instruments is not None:
+            start = time.perf_counter()
+        self.__merkle_tx_hash = merkle_append(self.__frontier, digest).hex()
+        if instruments is not None:
+            instruments.record('merkle', start)
+        return tx_hash
+
+    def add_transactions(self, senders, receivers, values):
+        '''
+        Adds a batch of transactions to the block. Each transaction gets its
+        own increasing timestamp and is hashed exactly like add_transaction
+        would hash it.
+
+        Parameters
+        ----------
+        senders : list
+            Senders of the coins.
+        receivers : list
+            Receivers of the coins.
+        values : list
+            Values of the coins transacted.
+
+        Returns
+        -------
+        list of str
+            hashes of the transactions.
+
+        '''
+
+        instruments = self.__instruments
+        ts = reserve_timestamps(len(values))
+        parties = self.__parties
+        sender_codes = [parties.intern(s) for s in senders]
+        receiver_codes = [parties.intern(r) for r in receivers]
+        values = [float(v) for v in values]
+        if instruments is not None:
+            start = time.perf_counter()
+        pack_time, pack_value, sha256 = TX_TIME.pack, TX_VALUE.pack, hashlib.sha256
+        digests = [sha256(pack_time(ts + i) + parties.get_encoded(s) + parties.get_encoded(r) + pack_value(v)).digest()
+                   for i, (s, r, v) in enumerate(zip(sender_codes, receiver_codes, values))]
+        if instruments is not None:
+            instruments.record('hashing', start, bytes_hashed=sum(16 + len(parties.get_encoded(s)) + len(parties.get_encoded(r))
+                                                                   for s, r in zip(sender_codes, receiver_codes)))
+        n, k = self.__size, len(digests)
+        if n + k > self.__values.shape[0]:
+            self.__allocate(max(2 * self.__values.shape[0], n + k))
+        self.__timestamps[n:n + k] = np.arange(ts, ts + k, dtype=np.int64)
+        self.__senders[n:n + k] = sender_codes
+        self.__receivers[n:n + k] = receiver_codes
+        self.__values[n:n + k] = values
+        self.__digests[n:n + k] = np.frombuffer(b''.join(digests), dtype=np.uint8).reshape(k, 32)
+        self.__size = n + k
+        self.__transactions = None
+        if instruments is not None:
+            start = time.perf_counter()
+        for digest in digests:
+            merkle_push(self.__frontier, digest)
+        if k:
+            self.__merkle_tx_hash = merkle_fold(self.__frontier).hex()
+        if instruments is not None:
+            instruments.record('merkle', start)
+        return [digest.hex() for digest in digests]
+
+    def __get_transactions(self):
+        '''
+        Returns the transactions of the block as a DataFrame, building it from
+        the column buffers on first use
+
+        Returns
+        -------
+        DataFrame
+            transactions contained by the block.
+
+        '''
+
+        if self.__transactions is None:
+            n = self.__size
+            self.__transactions = pd.DataFrame({
+                self.__col_names[0]: self.__timestamps[:n].astype('datetime64[ns]'),
+                self.__col_names[1]: self.__parties.decode(self.__senders[:n]),
+                self.__col_names[2]: self.__parties.decode(self.__receivers[:n]),
+                self.__col_names[3]: self.__values[:n].copy(),
+                self.__col_names[4]: [self.__digests[i].tobytes().hex() for i in range(n)]},
+                columns = self.__col_names)
+        return self.__transactions
+        
+    def display_transactions(self): 
+        '''
+        Displays the transactions in the block
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.display_header()
+        print(self.__get_transactions()[['Timestamp','Sender','Receiver','Value']].to_string(index = False))
+    
+    def get_size(self): 
+        '''
+        Returns the number of transactions in the block
+
+        Returns
+        -------
+        int
+            Number of tranactions in the block.
+
+        '''
+
+        return self.__size
+    
+    def set_status(self, status):
+        '''
+        Sets the status of the block
+
+        Parameters
+        ----------
+        status : str
+            Sets the block status.
+
+        Returns
+        -------
+        None.
+
+        '''
+        
+        self.__status = status
+    
+    def set_block_hash(self, hash):
+        '''
+        Sets the block hash
+
+        Parameters
+        ----------
+        hash : str
+            calculated hash of the block.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__block_hash = hash
+    
+    def get_nbytes(self):
+        '''
+        Returns the size of the transaction columns of the block
+
+        Returns
+        -------
+        int
+            bytes used by the timestamp, sender, receiver, value and digest
+            columns.
+
+        '''
+
+        return self.__size * self.TX_BYTES
+
+    def get_first_timestamp(self):
+        '''
+        Returns the timestamp of the first transaction in the block
+
+        Returns
+        -------
+        int
+            nanoseconds since the epoch, or None if the block is empty.
+
+        '''
+
+        return int(self.__timestamps[0]) if self.__size else None
+
+    def set_prev_hash(self, prev_hash):
+        '''
+        Sets the hash of the previous block, which is only known once the
+        previous block is committed
+
+        Parameters
+        ----------
+        prev_hash : str
+            hash of the previous block in the chain.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__prev_hash = prev_hash
+
+    def set_commit_info(self, ts, nonce):
+        '''
+        Records the commit timestamp and nonce that went into the block hash
+
+        Parameters
+        ----------
+        ts : int
+            commit time in nanoseconds since the epoch.
+        nonce : int
+            nonce hashed into the block hash.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__commit_ts = ts
+        self.__nonce = nonce
+
+    def set_instruments(self, instruments):
+        '''
+        Sets the instruments recording the hashing and merkle time of the block
+
+        Parameters
+        ----------
+        instruments : Instruments
+            instruments to record into, or None.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__instruments = instruments
+
+    def get_simple_merkle_root(self): 
+        '''
+        Returns the merkle root hash of the transactions in the block. The root
+        of the binary merkle tree is maintained on every add_transaction, so
+        this is a constant-time read.
+
+        Returns
+        -------
+        str
+            merkle root hash of the transactions in the block.
+
+        '''
+
+        return self.__merkle_tx_hash
+    
+    def get_header(self):
+        '''
+        Returns the metadata of the block
+
+        Returns
+        -------
+        dict
+            sequence id, status, block hash, previous block hash, merkle root
+            and number of transactions.
+
+        '''
+
+        return {'seq_id': self.__seq_id, 'status': self.__status, 'block_hash': self.__block_hash,
+                'prev_hash': self.__prev_hash, 'merkle_root': self.__merkle_tx_hash, 'size': self.__size,
+                'commit_ts': self.__commit_ts, 'nonce': self.__nonce}
+
+    def get_columns(self):
+        '''
+        Returns the transaction columns of the block
+
+        Returns
+        -------
+        tuple
+            party dictionary followed by the timestamp (int64 ns), sender
+            code, receiver code, value and digest (uint8 x 32) arrays.
+
+        '''
+
+        n = self.__size
+        return (self.__parties, self.__timestamps[:n], self.__senders[:n], self.__receivers[:n],
+                self.__values[:n], self.__digests[:n])
+
+    def get_tx_digests(self):
+        '''
+        Returns the binary hashes of the transactions in the block
+
+        Returns
+        -------
+        list of bytes
+            transaction digests in block order.
+
+        '''
+
+        return [self.__digests[i].tobytes() for i in range(self.__size)]
+
+    def get_tx_digest(self, row):
+        '''
+        Returns the binary hash of one transaction in the block
+
+        Parameters
+        ----------
+        row : int
+            row of the transaction.
+
+        Returns
+        -------
+        bytes
+            transaction digest.
+
+        '''
+
+        return self.__digests[row].tobytes()
+
+    def get_transaction(self, row):
+        '''
+        Returns one transaction in the block
+
+        Parameters
+        ----------
+        row : int
+            row of the transaction.
+
+        Returns
+        -------
+        dict
+            Timestamp, Sender, Receiver, Value and TxHash of the transaction.
+
+        '''
+
+        return {self.__col_names[0]: pd.Timestamp(int(self.__timestamps[row])),
+                self.__col_names[1]: self.__parties.get_name(self.__senders[row]),
+                self.__col_names[2]: self.__parties.get_name(self.__receivers[row]),
+                self.__col_names[3]: float(self.__values[row]),
+                self.__col_names[4]: self.__digests[row].tobytes().hex()}
+
+    def get_rows(self, rows):
+        '''
+        Returns selected transactions of the block as columns
+
+        Parameters
+        ----------
+        rows : ndarray
+            rows of the transactions to return.
+
+        Returns
+        -------
+        dict
+            Timestamp, Sender, Receiver, Value, TxHash and SeqId arrays.
+
+        '''
+
+        return {'Timestamp': self.__timestamps[rows].view('datetime64[ns]'),
+                'Sender': self.__parties.decode(self.__senders[rows]),
+                'Receiver': self.__parties.decode(self.__receivers[rows]),
+                'Value': self.__values[rows],
+                'TxHash': np.array([self.__digests[row].tobytes().hex() for row in rows], dtype=object),
+                'SeqId': np.full(len(rows), self.__seq_id, dtype=np.int64)}
+
+    def get_values(self):
+        '''
+        Returns the coin values in the transactions of the block
+
+        Returns
+        -------
+        ndarray
+            float64 view of the coin values in the transactions of the block.
+
+        '''
+        
+        return self.__values[:self.__size]
+
+    def get_timestamps(self):
+        '''
+        Returns the timestamps of the transactions of the block
+
+        Returns
+        -------
+        ndarray
+            datetime64[ns] view of the transaction timestamps.
+
+        '''
+
+        return self.__timestamps[:self.__size].view('datetime64[ns]')
+
+class ChainRenderer:
+    '''
+    Streams block headers and transactions to a file through a buffer of
+    about buffer_size bytes. 'text' writes the display_header lines followed
+    by "Timestamp, Sender, Receiver, Value" lines, 'csv' writes one header or
+    transaction row per line tagged with H or T, and 'binary' writes tagged
+    records that ChainRenderer.read decodes:
+
+        H  seq_id q, status B, block_hash 32s, prev_hash 32s, merkle 32s, size I
+        P  code i, length H, name
+        T  count I, then count rows of TX_DTYPE
+
+    Party names are sent once with a P record before the first T record that
+    uses them.
+    '''
+
+    HEADER = struct.Struct('<cqB32s32s32sI')
+    PARTY = struct.Struct('<ciH')
+    ROWS = struct.Struct('<cI')
+    TX_DTYPE = np.dtype([('timestamp', '<i8'), ('sender', '<i4'), ('receiver', '<i4'),
+                         ('value', '<f8'), ('tx_hash', 'u1', (32,))])
+    STATUSES = STATUSES
+
+    def __init__(self, file=None, format='text', buffer_size=1 << 16, chunk_rows=4096):
+        '''
+        Constructor of the ChainRenderer class
+
+        Parameters
+        ----------
+        file : file, optional
+            text stream for 'text' and 'csv', binary stream for 'binary'. The
+            default is None, which writes to stdout.
+        format : str, optional
+            'text', 'csv' or 'binary'. The default is 'text'.
+        buffer_size : int, optional
+            bytes to buffer before writing. The default is 65536.
+        chunk_rows : int, optional
+            transactions rendered at a time. The default is 4096.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        if format not in ('text', 'csv', 'binary'):
+            raise ValueError('Unknown display format ' + str(format))
+        if file is None:
+            file = sys.stdout
+            if format == 'binary':
+                sys.stdout.flush()
+                file = sys.stdout.buffer
+        self.__file = file
+        self.__format = format
+        self.__buffer = []
+        self.__buffered = 0
+        self.__buffer_size = buffer_size
+        self.__chunk_rows = chunk_rows
+        self.__sent_parties = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def __write(self, data):
+        '''
+        Buffers data and writes the buffer out once it is full
+
+        Parameters
+        ----------
+        data : str or bytes
+            rendered output.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__buffer.append(data)
+        self.__buffered += len(data)
+        if self.__buffered >= self.__buffer_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes out the buffer
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        if self.__buffer:
+            self.__file.write(('' if self.__format != 'binary' else b'').join(self.__buffer))
+            self.__buffer = []
+            self.__buffered = 0
+        self.__file.flush()
+
+    def write_header(self, block, size=None):
+        '''
+        Renders the header of a block
+
+        Parameters
+        ----------
+        block : Block or dict
+            block to render, or its header.
+        size : int, optional
+            number of transactions to report. The default is None, the size
+            of the block.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        header = block if isinstance(block, dict) else block.get_header()
+        size = header['size'] if size is None else size
+        if self.__format == 'binary':
+            self.__write(self.HEADER.pack(b'H', header['seq_id'], self.STATUSES.index(header['status']),
+                                          *(bytes.fromhex(header[key] or '') for key in ('block_hash', 'prev_hash', 'merkle_root')),
+                                          size))
+        else:
+            self.__write(("{seq_id}, {status}, {block_hash}, {prev_hash}, {merkle}, {trans_count}\n" if self.__format == 'text'
+                          else "H,{seq_id},{status},{block_hash},{prev_hash},{merkle},{trans_count}\n").format(
+                seq_id = header['seq_id'], status = header['status'], block_hash = header['block_hash'],
+                prev_hash = header['prev_hash'], merkle = header['merkle_root'], trans_count = size))
+
+    def write_transactions(self, block, start=0, stop=None):
+        '''
+        Renders rows start to stop of a block in chunks of chunk_rows
+
+        Parameters
+        ----------
+        block : Block
+            block to render.
+        start : int, optional
+            first row. The default is 0.
+        stop : int, optional
+            row to stop before. The default is None, the size of the block.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        parties, timestamps, senders, receivers, values, digests = block.get_columns()
+        stop = block.get_size() if stop is None else stop
+        seq_id = block.get_header()['seq_id']
+        for first in range(start, stop, self.__chunk_rows):
+            rows = slice(first, min(first + self.__chunk_rows, stop))
+            if self.__format == 'binary':
+                codes = max(int(senders[rows].max()), int(receivers[rows].max())) + 1
+                for code in range(self.__sent_parties, codes):
+                    name = parties.get_name(code).encode('utf-8')
+                    self.__write(self.PARTY.pack(b'P', code, len(name)) + name)
+                self.__sent_parties = max(self.__sent_parties, codes)
+                chunk = np.empty(rows.stop - rows.start, dtype=self.TX_DTYPE)
+                chunk['timestamp'], chunk['sender'], chunk['receiver'] = timestamps[rows], senders[rows], receivers[rows]
+                chunk['value'], chunk['tx_hash'] = values[rows], digests[rows]
+                self.__write(self.ROWS.pack(b'T', len(chunk)) + chunk.tobytes())
+                continue
+            times = np.datetime_as_string(timestamps[rows].view('datetime64[ns]').astype('datetime64[us]'))
+            names = [parties.decode(senders[rows]), parties.decode(receivers[rows])]
+            if self.__format == 'text':
+                lines = ["{}, {}, {}, {}\n".format(t.replace('T', ' '), s, r, v)
+                         for t, s, r, v in zip(times, *names, values[rows].tolist())]
+            else:
+                lines = ["T,{},{},{},{},{},{}\n".format(seq_id, t, s, r, v, d.hex())
+                         for t, s, r, v, d in zip(times, *names, values[rows].tolist(),
+                                                  map(bytes, digests[rows]))]
+            self.__write(''.join(lines))
+
+    @classmethod
+    def read(cls, file):
+        '''
+        Decodes a binary rendering
+
+        Parameters
+        ----------
+        file : file
+            binary stream written by a 'binary' ChainRenderer.
+
+        Returns
+        -------
+        list of tuple
+            (header, transactions) per block, header as a dict and
+            transactions as a DataFrame like Block.display_transactions shows.
+
+        '''
+
+        names, blocks = [], []
+        while True:
+            tag = file.read(1)
+            if not tag:
+                columns = ['Timestamp', 'Sender', 'Receiver', 'Value', 'TxHash']
+                return [(header, pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns))
+                        for header, frames in blocks]
+            if tag == b'H':
+                seq_id, status, block_hash, prev_hash, merkle, size = cls.HEADER.unpack(tag + file.read(cls.HEADER.size - 1))[1:]
+                blocks.append(({'seq_id': seq_id, 'status': cls.STATUSES[status],
+                                'block_hash': block_hash.hex() if any(block_hash) else None,
+                                'prev_hash': prev_hash.hex() if any(prev_hash) else None,
+                                'merkle_root': merkle.hex() if any(merkle) else None, 'size': size}, []))
+            elif tag == b'P':
+                code, length = cls.PARTY.unpack(tag + file.read(cls.PARTY.size - 1))[1:]
+                names[len(names):code + 1] = [None] * (code + 1 - len(names))
+                names[code] = file.read(length).decode('utf-8')
+            elif tag == b'T':
+                count = cls.ROWS.unpack(tag + file.read(cls.ROWS.size - 1))[1]
+                chunk = np.frombuffer(file.read(count * cls.TX_DTYPE.itemsize), dtype=cls.TX_DTYPE)
+                blocks[-1][1].append(pd.DataFrame({'Timestamp': pd.to_datetime(chunk['timestamp']),
+                                                   'Sender': [names[c] for c in chunk['sender']],
+                                                   'Receiver': [names[c] for c in chunk['receiver']],
+                                                   'Value': chunk['value'],
+                                                   'TxHash': [bytes(d).hex() for d in chunk['tx_hash']]}))
+            else:
+                raise ValueError('Corrupt rendering, unknown record ' + repr(tag))
+
+class SegmentStore:
+    '''
+    Append-only store of committed blocks in fixed-format segment files.
+
+    Each segment file starts with FILE_HEADER (magic and chain id) followed by
+    block records. A record is a RECORD header followed by the transaction
+    columns: timestamps, values, digests, sender codes and receiver codes.
+    Party names live once in the chain's dictionary file, an append-only list
+    of length-prefixed names in code order. Blocks are read back through
+    memory maps, so only their locations are held in memory.
+    '''
+
+    FILE_HEADER = struct.Struct('<8s32s')
+    RECORD = struct.Struct('<4sIqqqB7x32s32s32sQII')
+    FILE_MAGIC = b'PCSEG002'
+    RECORD_MAGIC = b'BLK1'
+    DICTIONARY_MAGIC = b'PCDICT01'
+
+    def __init__(self, path, chain_id, parties, fsync='always', segment_size=64 << 20):
+        '''
+        Constructor of the SegmentStore class. Opens the segments found in
+        path, discarding a truncated or torn block at the tail of the last
+        segment, or starts a new store.
+
+        Parameters
+        ----------
+        path : str
+            directory holding the segment files.
+        chain_id : str
+            id of the chain, used when the store is new.
+        parties : PartyDictionary
+            empty dictionary of the chain, filled from the dictionary file.
+        fsync : str or int, optional
+            'always' to fsync every block, 'never' to leave it to the OS, or
+            fsync every N blocks. The default is 'always'.
+        segment_size : int, optional
+            size in bytes after which a new segment is started. The default
+            is 64 MiB.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        os.makedirs(path, exist_ok=True)
+        self.__path = path
+        self.__fsync = fsync
+        self.__segment_size = segment_size
+        self.__unsynced = 0
+        self.__segments = []
+        self.__maps = []
+        self.__parties = parties
+        self.__open_dictionary(os.path.join(path, 'parties.pcd'))
+        self.__block_segments = array.array('i')
+        self.__block_offsets = array.array('q')
+        self.__chain_id = chain_id
+        self.__last_hash = None
+        names = sorted(f for f in os.listdir(path) if f.startswith('segment-') and f.endswith('.pcs'))
+        for i, name in enumerate(names):
+            self.__scan_segment(os.path.join(path, name), i == len(names) - 1)
+        if self.__segments:
+            self.__file = open(self.__segments[-1], 'r+b')
+            self.__file.seek(0, os.SEEK_END)
+        else:
+            self.__new_segment()
+
+    def __open_dictionary(self, filename):
+        '''
+        Loads the party dictionary file, discarding a torn name at its tail,
+        and opens it for appending
+
+        Parameters
+        ----------
+        filename : str
+            dictionary file.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__dictionary = open(filename, 'a+b')
+        self.__dictionary.seek(0)
+        data = self.__dictionary.read()
+        if not data.startswith(self.DICTIONARY_MAGIC):
+            if data:
+                raise ValueError('Dictionary ' + filename + ' is not a PandasChain dictionary')
+            self.__dictionary.write(self.DICTIONARY_MAGIC)
+            data = self.DICTIONARY_MAGIC
+        pos = len(self.DICTIONARY_MAGIC)
+        while pos + 2 <= len(data):
+            size = struct.unpack_from('<H', data, pos)[0]
+            if pos + 2 + size > len(data):
+                break
+            self.__parties.intern(data[pos + 2:pos + 2 + size].decode('utf-8'))
+            pos += 2 + size
+        if pos != len(data):
+            self.__dictionary.truncate(pos)
+        self.__dictionary.flush()
+        self.__persisted_parties = len(self.__parties)
+
+    def __persist_parties(self):
+        '''
+        Appends the names interned since the last call to the dictionary file
+
+        Returns
+        -------
+        bool
+            True if any name was written.
+
+        '''
+
+        names = self.__parties.get_names()
+        if self.__persisted_parties == len(names):
+            return False
+        new_codes = range(self.__persisted_parties, len(names))
+        self.__dictionary.write(b''.join(self.__parties.get_encoded(code) for code in new_codes))
+        self.__persisted_parties += len(new_codes)
+        return True
+
+    def __scan_segment(self, filename, is_last):
+        '''
+        Reads the record headers of a segment and records its blocks
+
+        Parameters
+        ----------
+        filename : str
+            segment file to scan.
+        is_last : bool
+            whether this is the last segment, whose tail may be truncated.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        size = os.path.getsize(filename)
+        if size < self.FILE_HEADER.size:
+            if not is_last:
+                raise ValueError('Segment ' + filename + ' is truncated')
+            os.remove(filename)
+            return
+        with open(filename, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, chain_id = self.FILE_HEADER.unpack_from(mm, 0)
+        if magic != self.FILE_MAGIC:
+            raise ValueError('Segment ' + filename + ' is not a PandasChain segment')
+        self.__chain_id = chain_id.hex()
+        offset = self.FILE_HEADER.size
+        while offset < size:
+            header = self.__read_record(mm, offset, size)
+            end = None if header is None else offset + self.RECORD.size + header[9]
+            if end is not None and end == size and zlib.crc32(mm[offset + self.RECORD.size:end]) != header[10]:
+                end = None
+            if end is None:
+                if not is_last:
+                    raise ValueError('Segment ' + filename + ' is corrupt at offset ' + str(offset))
+                with open(filename, 'r+b') as f:
+                    f.truncate(offset)
+                break
+            self.__block_segments.append(len(self.__segments))
+            self.__block_offsets.append(offset)
+            self.__last_hash = header[7].hex()
+            offset = end
+        self.__segments.append(filename)
+        self.__maps.append(mm)
+
+    def __read_record(self, mm, offset, size):
+        '''
+        Reads and checks the record header at offset
+
+        Parameters
+        ----------
+        mm : mmap
+            mapped segment.
+        offset : int
+            offset of the record.
+        size : int
+            size of the segment.
+
+        Returns
+        -------
+        tuple
+            unpacked RECORD fields, or None if the header is truncated, corrupt
+            or out of sequence.
+
+        '''
+
+        if offset + self.RECORD.size > size:
+            return None
+        raw = mm[offset:offset + self.RECORD.size]
+        header = self.RECORD.unpack(raw)
+        if header[0] != self.RECORD_MAGIC or zlib.crc32(raw[:-4]) != header[11] \
+                or header[2] != len(self.__block_offsets) \
+                or offset + self.RECORD.size + header[9] > size:
+            return None
+        return header
+
+    def __new_segment(self):
+        '''
+        Starts a new segment file and makes it the active segment
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        filename = os.path.join(self.__path, 'segment-{:06d}.pcs'.format(len(self.__segments)))
+        self.__file = open(filename, 'w+b')
+        self.__file.write(self.FILE_HEADER.pack(self.FILE_MAGIC, bytes.fromhex(self.__chain_id)))
+        self.__file.flush()
+        self.__segments.append(filename)
+        self.__maps.append(None)
+
+    def get_locations(self, start, stop):
+        '''
+        Returns where blocks are stored, so that other processes can map
+        them with read_segment_blocks
+
+        Parameters
+        ----------
+        start : int
+            first seq_id.
+        stop : int
+            seq_id to stop before.
+
+        Returns
+        -------
+        list of tuple
+            (segment filename, offset) of each block.
+
+        '''
+
+        return [(self.__segments[self.__block_segments[seq_id]], self.__block_offsets[seq_id])
+                for seq_id in range(start, stop)]
+
+    def get_chain_id(self):
+        '''
+        Returns the id of the chain stored in the segments
+
+        Returns
+        -------
+        str
+            chain id.
+
+        '''
+
+        return self.__chain_id
+
+    def get_last_hash(self):
+        '''
+        Returns the block hash of the last stored block
+
+        Returns
+        -------
+        str
+            block hash, or None if the store is empty.
+
+        '''
+
+        return self.__last_hash
+
+    def append(self, block):
+        '''
+        Appends a committed block to the active segment
+
+        Parameters
+        ----------
+        block : Block
+            committed block.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.publish(self.write(block))
+
+    def write(self, block):
+        '''
+        Writes a committed block to the active segment and syncs it as the
+        fsync policy asks, without making it visible to readers yet. Only one
+        thread may write at a time; publish must be called in write order.
+
+        Parameters
+        ----------
+        block : Block
+            committed block.
+
+        Returns
+        -------
+        tuple
+            location of the block, for publish.
+
+        '''
+
+        header = block.get_header()
+        _, timestamps, senders, receivers, values, digests = block.get_columns()
+        if self.__persist_parties():
+            self.__dictionary.flush()
+            if self.__fsync != 'never':
+                os.fsync(self.__dictionary.fileno())
+        parts = [np.ascontiguousarray(timestamps, dtype=np.int64).tobytes(),
+                 np.ascontiguousarray(values, dtype=np.float64).tobytes(),
+                 np.ascontiguousarray(digests, dtype=np.uint8).tobytes(),
+                 np.ascontiguousarray(senders, dtype=np.int32).tobytes(),
+                 np.ascontiguousarray(receivers, dtype=np.int32).tobytes()]
+        crc = 0
+        for part in parts:
+            crc = zlib.crc32(part, crc)
+        length = sum(len(part) for part in parts)
+        flags = (header['prev_hash'] is not None) | (header['merkle_root'] is not None) << 1
+        record = self.RECORD.pack(self.RECORD_MAGIC, header['size'], header['seq_id'], header['commit_ts'] or 0,
+                                  header['nonce'] or 0, flags, bytes.fromhex(header['prev_hash'] or '00' * 32),
+                                  bytes.fromhex(header['block_hash']), bytes.fromhex(header['merkle_root'] or '00' * 32),
+                                  length, crc, 0)
+        record = record[:-4] + struct.pack('<I', zlib.crc32(record[:-4]))
+        offset = self.__file.tell()
+        if offset > self.FILE_HEADER.size and offset + len(record) + length > self.__segment_size:
+            self.__sync(True)
+            self.__file.close()
+            self.__new_segment()
+            offset = self.__file.tell()
+        self.__file.write(record)
+        for part in parts:
+            self.__file.write(part)
+        self.__unsynced += 1
+        self.__sync(self.__fsync == 'always' or (isinstance(self.__fsync, int) and self.__unsynced >= self.__fsync))
+        return len(self.__segments) - 1, offset, header['block_hash']
+
+    def publish(self, location):
+        '''
+        Makes a block written by write visible to readers
+
+        Parameters
+        ----------
+        location : tuple
+            value returned by write.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        segment, offset, block_hash = location
+        self.__block_segments.append(segment)
+        self.__block_offsets.append(offset)
+        self.__last_hash = block_hash
+
+    def __sync(self, force):
+        '''
+        Flushes the active segment and fsyncs it if forced
+
+        Parameters
+        ----------
+        force : bool
+            whether to fsync the segment to disk.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__file.flush()
+        if force and self.__fsync != 'never':
+            os.fsync(self.__file.fileno())
+            self.__unsynced = 0
+
+    def close(self):
+        '''
+        Flushes, fsyncs and closes the active segment
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        if not self.__file.closed:
+            self.__sync(True)
+            self.__file.close()
+            self.__dictionary.close()
+
+    def __len__(self):
+        return len(self.__block_offsets)
+
+    def __iter__(self):
+        for seq_id in range(len(self.__block_offsets)):
+            yield self[seq_id]
+
+    def __getitem__(self, seq_id):
+        '''
+        Maps a stored block back into a Block without copying its columns
+
+        Parameters
+        ----------
+        seq_id : int
+            sequence id of the block.
+
+        Returns
+        -------
+        Block
+            the committed block.
+
+        '''
+
+        segment = self.__block_segments[seq_id]
+        offset = self.__block_offsets[seq_id]
+        mm = self.__maps[segment]
+        if mm is None or len(mm) < offset + self.RECORD.size:
+            with open(self.__segments[segment], 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            self.__maps[segment] = mm
+        (_, n, seq, commit_ts, nonce, flags, prev_hash, block_hash, merkle_root,
+         length, _, _) = self.RECORD.unpack_from(mm, offset)
+        if len(mm) < offset + self.RECORD.size + length:
+            with open(self.__segments[segment], 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            self.__maps[segment] = mm
+        pos = offset + self.RECORD.size
+        timestamps = np.frombuffer(mm, dtype=np.int64, count=n, offset=pos)
+        values = np.frombuffer(mm, dtype=np.float64, count=n, offset=pos + 8 * n)
+        digests = np.frombuffer(mm, dtype=np.uint8, count=32 * n, offset=pos + 16 * n).reshape(n, 32)
+        senders = np.frombuffer(mm, dtype=np.int32, count=n, offset=pos + 48 * n)
+        receivers = np.frombuffer(mm, dtype=np.int32, count=n, offset=pos + 52 * n)
+        header = {'seq_id': seq, 'status': 'COMMITTED', 'block_hash': block_hash.hex(),
+                  'prev_hash': prev_hash.hex() if flags & 1 else None,
+                  'merkle_root': merkle_root.hex() if flags & 2 else None, 'size': n,
+                  'commit_ts': commit_ts, 'nonce': nonce}
+        return Block.from_columns(header, self.__parties, timestamps, senders, receivers, values, digests)
+
+class ArchiveStore:
+    '''
+    Committed blocks of an in-memory chain, tiered by age as set by an
+    ArchivePolicy. Recent blocks stay in memory as Blocks. Older blocks are
+    kept as encoded headers only; their transaction columns (the
+    SegmentStore payload layout) are compressed per block into one archive
+    file per group of blocks and tier, and rewritten with the next codec as
+    the group ages. Archived blocks are rehydrated on access through an LRU
+    cache. The archive is scratch space and is deleted by close.
+    '''
+
+    def __init__(self, parties, policy):
+        '''
+        Constructor of the ArchiveStore class
+
+        Parameters
+        ----------
+        parties : PartyDictionary
+            dictionary of the chain.
+        policy : ArchivePolicy
+            tiers, group size and cache size.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__parties = parties
+        self.__policy = policy
+        self.__directory = tempfile.mkdtemp(prefix='pandaschain-', dir=policy.directory)
+        self.__blocks = []
+        self.__headers = []
+        self.__groups = {}
+        self.__cache = collections.OrderedDict()
+        self.__lock = threading.RLock()
+        self.__hits = 0
+        self.__misses = 0
+
+    def __len__(self):
+        return len(self.__headers)
+
+    def __iter__(self):
+        for seq_id in range(len(self.__headers)):
+            yield self[seq_id]
+
+    def append(self, block):
+        '''
+        Appends a committed block and archives the groups that became old
+        enough for their next tier
+
+        Parameters
+        ----------
+        block : Block
+            committed block.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        with self.__lock:
+            self.__blocks.append(block)
+            self.__headers.append(encode_header(block.get_header()))
+            count = len(self.__headers)
+            size = self.__policy.group_blocks
+            for tier, (age, _) in enumerate(self.__policy.tiers):
+                last = count - 1 - age
+                if last >= 0 and (last + 1) % size == 0:
+                    self.__archive(last + 1 - size, tier)
+
+    def __archive(self, first, tier):
+        '''
+        Writes a group of blocks into the archive file of a tier and drops
+        its previous copy
+
+        Parameters
+        ----------
+        first : int
+            seq_id of the first block of the group.
+        tier : int
+            index of the tier in the policy.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        codec = self.__policy.tiers[tier][1]
+        compress = ArchivePolicy.CODECS[codec][0]
+        old = self.__groups.get(first)
+        filename = os.path.join(self.__directory, 'tier{}-{}-{}.arc'.format(tier, codec, first))
+        locations = []
+        with open(filename, 'wb') as f:
+            for seq_id in range(first, first + self.__policy.group_blocks):
+                data = compress(self.__payload(seq_id))
+                locations.append((f.tell(), len(data)))
+                f.write(data)
+        self.__groups[first] = (tier, filename, locations)
+        for seq_id in range(first, first + self.__policy.group_blocks):
+            self.__blocks[seq_id] = None
+        if old is not None:
+            os.remove(old[1])
+
+    def __payload(self, seq_id):
+        '''
+        Returns the uncompressed transaction columns of a block
+
+        Parameters
+        ----------
+        seq_id : int
+            sequence id of the block.
+
+        Returns
+        -------
+        bytes
+            timestamps, values, digests, sender codes and receiver codes.
+
+        '''
+
+        block = self.__blocks[seq_id]
+        if block is None:
+            return self.__read(seq_id)
+        _, timestamps, senders, receivers, values, digests = block.get_columns()
+        return b''.join([np.ascontiguousarray(timestamps, dtype=np.int64).tobytes(),
+                         np.ascontiguousarray(values, dtype=np.float64).tobytes(),
+                         np.ascontiguousarray(digests, dtype=np.uint8).tobytes(),
+                         np.ascontiguousarray(senders, dtype=np.int32).tobytes(),
+                         np.ascontiguousarray(receivers, dtype=np.int32).tobytes()])
+
+    def __read(self, seq_id):
+        '''
+        Reads and decompresses the payload of an archived block
+
+        Parameters
+        ----------
+        seq_id : int
+            sequence id of the block.
+
+        Returns
+        -------
+        bytes
+            the payload.
+
+        '''
+
+        first = seq_id - seq_id % self.__policy.group_blocks
+        tier, filename, locations = self.__groups[first]
+        offset, length = locations[seq_id - first]
+        with open(filename, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        return ArchivePolicy.CODECS[self.__policy.tiers[tier][1]][1](data)
+
+    def get_header(self, seq_id):
+        '''
+        Returns the header of a block without rehydrating it
+
+        Parameters
+        ----------
+        seq_id : int
+            sequence id of the block.
+
+        Returns
+        -------
+        dict
+            block metadata as returned by Block.get_header.
+
+        '''
+
+        return decode_header(self.__headers[seq_id])[0]
+
+    def __getitem__(self, seq_id):
+        '''
+        Returns a block, rehydrating it from the archive if needed
+
+        Parameters
+        ----------
+        seq_id : int
+            sequence id of the block.
+
+        Returns
+        -------
+        Block
+            the committed block.
+
+        '''
+
+        with self.__lock:
+            block = self.__blocks[seq_id]
+            if block is not None:
+                return block
+            block = self.__cache.get(seq_id)
+            if block is not None:
+                self.__hits += 1
+                self.__cache.move_to_end(seq_id)
+                return block
+            self.__misses += 1
+            header = self.get_header(seq_id)
+            n = header['size']
+            payload = self.__read(seq_id)
+            block = Block.from_columns(header, self.__parties,
+                                       np.frombuffer(payload, dtype=np.int64, count=n),
+                                       np.frombuffer(payload, dtype=np.int32, count=n, offset=48 * n),
+                                       np.frombuffer(payload, dtype=np.int32, count=n, offset=52 * n),
+                                       np.frombuffer(payload, dtype=np.float64, count=n, offset=8 * n),
+                                       np.frombuffer(payload, dtype=np.uint8, count=32 * n, offset=16 * n).reshape(n, 32))
+            self.__cache[seq_id] = block
+            while len(self.__cache) > self.__policy.cache_blocks:
+                self.__cache.popitem(last=False)
+            return block
+
+    def stats(self):
+        '''
+        Returns the size of each tier and the cache counters
+
+        Returns
+        -------
+        dict
+            resident blocks, archived blocks and bytes per codec, cached
+            blocks, cache hits and misses.
+
+        '''
+
+        with self.__lock:
+            tiers = {}
+            for tier, _, locations in self.__groups.values():
+                codec = self.__policy.tiers[tier][1]
+                blocks, nbytes = tiers.get(codec, (0, 0))
+                tiers[codec] = (blocks + len(locations), nbytes + sum(length for _, length in locations))
+            return {'resident': sum(block is not None for block in self.__blocks),
+                    'tiers': {codec: {'blocks': blocks, 'bytes': nbytes} for codec, (blocks, nbytes) in tiers.items()},
+                    'cached': len(self.__cache), 'hits': self.__hits, 'misses': self.__misses}
+
+    def close(self):
+        '''
+        Deletes the archive
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        shutil.rmtree(self.__directory, ignore_errors=True)
+
+class ReplicationServer:
+    '''
+    Ships the committed blocks of a primary PandasChain to ChainFollowers
+    over TCP or a Unix socket.
+
+    A follower connects and sends the u64 seq_id to start from; the server
+    answers with the 32 byte chain ID, then sends every committed block from
+    that seq_id on as a frame: u32 length, u64 committed blocks on the
+    primary, and the encode_block payload. A commit listener wakes the
+    connection threads, which always read the blocks back from the chain, so
+    catch-up and live shipping are the same loop.
+    '''
+
+    def __init__(self, chain, address=('127.0.0.1', 0)):
+        '''
+        Constructor of the ReplicationServer class
+
+        Parameters
+        ----------
+        chain : PandasChain
+            primary chain.
+        address : tuple or str, optional
+            (host, port) to listen on with TCP, or the path of a Unix socket.
+            The default is ('127.0.0.1', 0), a free local port.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__chain = chain
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)
+        self.__listener = socket.socket(family, socket.SOCK_STREAM)
+        self.__listener.bind(address)
+        self.__listener.listen()
+        self.__address = self.__listener.getsockname()
+        self.__followers = {}
+        self.__lock = threading.Lock()
+        self.__blocks_sent = 0
+        self.__bytes_sent = 0
+        self.__running = True
+        chain.add_commit_listener(self.__on_commit)
+        self.__acceptor = threading.Thread(target=self.__accept, name='replication-server', daemon=True)
+        self.__acceptor.start()
+
+    def get_address(self):
+        '''
+        Returns the address the server listens on
+
+        Returns
+        -------
+        tuple or str
+            (host, port) or the Unix socket path.
+
+        '''
+
+        return self.__address
+
+    def __on_commit(self, block):
+        '''
+        Commit listener waking every connection thread
+
+        Parameters
+        ----------
+        block : Block
+            the committed block.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        with self.__lock:
+            for wakeups in self.__followers.values():
+                wakeups.put(True)
+
+    def __accept(self):
+        '''
+        Body of the accepting thread
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        while self.__running:
+            try:
+                conn, _ = self.__listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.__serve, args=(conn,), name='replication-follower', daemon=True).start()
+
+    def __serve(self, conn):
+        '''
+        Body of a connection thread: ships blocks from the seq_id the
+        follower asked for until the follower or the server goes away
+
+        Parameters
+        ----------
+        conn : socket
+            connection to the follower.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        wakeups = queue.Queue()
+        try:
+            seq_id = HELLO.unpack(recv_exact(conn, HELLO.size))[0]
+            with self.__lock:
+                self.__followers[conn] = wakeups
+            conn.sendall(hash_bytes(self.__chain.get_chain_id()))
+            while self.__running:
+                block = self.__chain.get_committed(seq_id)
+                if block is None:
+                    if not wakeups.get():
+                        return
+                    continue
+                payload = encode_block(block)
+                conn.sendall(FRAME.pack(len(payload), self.__chain.get_committed_count()) + payload)
+                seq_id += 1
+                with self.__lock:
+                    self.__blocks_sent += 1
+                    self.__bytes_sent += FRAME.size + len(payload)
+        except OSError:
+            pass
+        finally:
+            with self.__lock:
+                self.__followers.pop(conn, None)
+            conn.close()
+
+    def stats(self):
+        '''
+        Returns the shipping counters
+
+        Returns
+        -------
+        dict
+            connected followers, blocks and bytes sent.
+
+        '''
+
+        with self.__lock:
+            return {'followers': len(self.__followers), 'blocks_sent': self.__blocks_sent,
+                    'bytes_sent': self.__bytes_sent}
+
+    def close(self):
+        '''
+        Stops listening and disconnects every follower
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__running = False
+        self.__chain.remove_commit_listener(self.__on_commit)
+        try:
+            self.__listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.__listener.close()
+        with self.__lock:
+            for conn, wakeups in self.__followers.items():
+                wakeups.put(False)
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.__acceptor.join()
+        if isinstance(self.__address, str) and os.path.exists(self.__address):
+            os.unlink(self.__address)
+
+class ChainFollower:
+    '''
+    Keeps a PandasChain in sync with a ReplicationServer. A thread connects,
+    asks for the blocks after the last block of the replica and applies them
+    in order with PandasChain.apply_block, which checks prev_hash continuity,
+    the merkle root and the block hash. After a disconnect it reconnects and
+    catches up from where it stopped; a block that fails the checks stops it.
+    '''
+
+    def __init__(self, chain, address, retry=0.5):
+        '''
+        Constructor of the ChainFollower class. Starts following right away.
+
+        Parameters
+        ----------
+        chain : PandasChain
+            replica chain; it must not take transactions of its own.
+        address : tuple or str
+            address of the ReplicationServer.
+        retry : float, optional
+            seconds to wait before reconnecting. The default is 0.5.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__chain = chain
+        self.__address = address
+        self.__retry = retry
+        self.__socket = None
+        self.__error = None
+        self.__running = True
+        self.__applied = threading.Condition()
+        self.__blocks = 0
+        self.__transactions = 0
+        self.__bytes = 0
+        self.__connections = 0
+        self.__primary_blocks = chain.get_committed_count()
+        self.__delay = 0.0
+        self.__started = time.perf_counter()
+        self.__thread = threading.Thread(target=self.__run, name='replication-follower', daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        '''
+        Body of the follower thread
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        family = socket.AF_UNIX if isinstance(self.__address, str) else socket.AF_INET
+        while self.__running:
+            try:
+                with socket.socket(family, socket.SOCK_STREAM) as sock:
+                    self.__socket = sock
+                    sock.connect(self.__address)
+                    self.__connections += 1
+                    sock.sendall(HELLO.pack(self.__chain.get_committed_count()))
+                    chain_id = recv_exact(sock, 32).hex()
+                    while self.__running:
+                        size, primary_blocks = FRAME.unpack(recv_exact(sock, FRAME.size))
+                        block = self.__chain.apply_block(recv_exact(sock, size), chain_id)
+                        header = block.get_header()
+                        with self.__applied:
+                            self.__blocks += 1
+                            self.__transactions += header['size']
+                            self.__bytes += FRAME.size + size
+                            self.__primary_blocks = primary_blocks
+                            self.__delay = (to_ns(dt.datetime.now()) - header['commit_ts']) / 1e9
+                            self.__applied.notify_all()
+            except ValueError as e:
+                with self.__applied:
+                    self.__error = e
+                    self.__running = False
+                    self.__applied.notify_all()
+            except OSError:
+                if self.__running:
+                    time.sleep(self.__retry)
+
+    def wait_for(self, blocks, timeout=None):
+        '''
+        Waits until the replica holds a number of committed blocks
+
+        Parameters
+        ----------
+        blocks : int
+            number of committed blocks to wait for.
+        timeout : float, optional
+            seconds to wait at most. The default is None, no limit.
+
+        Returns
+        -------
+        bool
+            True if the replica got there, False on timeout or error.
+
+        '''
+
+        with self.__applied:
+            return self.__applied.wait_for(lambda: self.__chain.get_committed_count() >= blocks
+                                           or self.__error is not None, timeout) and self.__error is None
+
+    def stats(self):
+        '''
+        Returns the replication counters. lag_blocks is how many blocks the
+        primary had committed beyond the replica when the last frame was
+        sent, lag_seconds how long after its commit the last block was
+        applied.
+
+        Returns
+        -------
+        dict
+            blocks, transactions and bytes applied, connections, lag,
+            throughput and the error that stopped the follower, if any.
+
+        '''
+
+        with self.__applied:
+            elapsed = time.perf_counter() - self.__started
+            return {'blocks': self.__blocks, 'transactions': self.__transactions, 'bytes': self.__bytes,
+                    'connections': self.__connections,
+                    'lag_blocks': max(self.__primary_blocks - self.__chain.get_committed_count(), 0),
+                    'lag_seconds': self.__delay, 'blocks_per_second': self.__blocks / elapsed,
+                    'transactions_per_second': self.__transactions / elapsed, 'error': self.__error}
+
+    def close(self):
+        '''
+        Stops following
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__running = False
+        if self.__socket is not None:
+            try:
+                self.__socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.__thread.join()
+
+class Mempool:
+    '''
+    Bounded pool of pending transactions in front of a PandasChain.
+
+    Producer threads append to a deque, whose appends are atomic, and only
+    touch the chain lock through the sequencer. A single sequencer thread
+    drains the pool in arrival order into the chain with add_transactions.
+    A semaphore bounds the number of pending transactions: producers only
+    block when the pool is full, for at most their submit timeout, and
+    otherwise just wait briefly on the semaphore's internal lock. A batch
+    the chain rejects is dropped and its error is reported by stats and
+    raised by close.
+    '''
+
+    def __init__(self, chain, capacity=100000, batch_size=10000):
+        '''
+        Constructor of the Mempool class. Starts the sequencer thread.
+
+        Parameters
+        ----------
+        chain : PandasChain
+            chain the transactions are sequenced into.
+        capacity : int, optional
+            maximum number of pending transactions. The default is 100000.
+        batch_size : int, optional
+            maximum number of transactions the sequencer hands to the chain at
+            once. The default is 10000.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__chain = chain
+        self.__capacity = capacity
+        self.__batch_size = batch_size
+        self.__pending = collections.deque()
+        self.__slots = threading.Semaphore(capacity)
+        self.__ready = threading.Event()
+        self.__running = True
+        self.__sequenced = 0
+        self.__failed = 0
+        self.__error = None
+        self.__started = time.perf_counter()
+        self.__sequencer = threading.Thread(target=self.__run_sequencer, name='mempool-sequencer', daemon=True)
+        self.__sequencer.start()
+
+    def submit(self, s, r, v, timeout=None):
+        '''
+        Adds a transaction to the pool, waiting for room if the pool is full
+
+        Parameters
+        ----------
+        s : str
+            Sender of the coins.
+        r : str
+            Receiver of the coins.
+        v : float
+            Value of the coins transacted.
+        timeout : float, optional
+            seconds to wait for room. The default is None, wait forever.
+
+        Raises
+        ------
+        queue.Full
+            if there is no room after timeout seconds.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        if not self.__slots.acquire(timeout=timeout):
+            raise queue.Full('Mempool is full')
+        self.__pending.append((s, r, v))
+        self.__ready.set()
+
+    def __run_sequencer(self):
+        '''
+        Body of the sequencer thread: drains pending transactions in arrival
+        order into the chain
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        while True:
+            self.__ready.wait(0.1)
+            self.__ready.clear()
+            while self.__pending:
+                batch = []
+                while self.__pending and len(batch) < self.__batch_size:
+                    batch.append(self.__pending.popleft())
+                senders, receivers, values = zip(*batch)
+                try:
+                    self.__chain.add_transactions(senders, receivers, values)
+                    self.__sequenced += len(batch)
+                except Exception as error:
+                    self.__failed += len(batch)
+                    self.__error = error
+                finally:
+                    self.__slots.release(len(batch))
+            if not self.__running and not self.__pending:
+                return
+
+    def close(self):
+        '''
+        Stops the sequencer once every pending transaction is in the chain
+
+        Raises
+        ------
+        Exception
+            the last error raised by the chain for a batch, if any.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__running = False
+        self.__ready.set()
+        self.__sequencer.join()
+        if self.__error is not None:
+            raise self.__error
+
+    def stats(self):
+        '''
+        Returns the queue depth and throughput of the pool
+
+        Returns
+        -------
+        dict
+            depth (pending transactions), capacity, number of sequenced
+            transactions, sequenced transactions per second since the pool
+            started, number of transactions in batches the chain rejected and
+            the last error it raised (None if there was none).
+
+        '''
+
+        elapsed = time.perf_counter() - self.__started
+        return {'depth': len(self.__pending), 'capacity': self.__capacity, 'sequenced': self.__sequenced,
+                'throughput': self.__sequenced / elapsed if elapsed > 0 else 0.0,
+                'failed': self.__failed, 'error': self.__error}
+
+class AsyncPandasChain:
+    '''
+    asyncio front end for a PandasChain.
+
+    Transactions submitted during one tick of the event loop are handed to
+    the chain as one add_transactions batch on a single worker thread, so the
+    loop never hashes or commits. Each submission gets a future that resolves
+    once the block holding the transaction is committed.
+    '''
+
+    def __init__(self, chain):
+        '''
+        Constructor of the AsyncPandasChain class. Must be created inside the
+        running event loop.
+
+        Parameters
+        ----------
+        chain : PandasChain
+            chain to submit transactions to. A chain with a background
+            committer or a max_age policy acknowledges full blocks without
+            waiting for the next transaction.
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__chain = chain
+        self.__loop = asyncio.get_running_loop()
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='pandaschain')
+        self.__batch = []
+        self.__waiting = {}
+        self.__acks = collections.deque()
+        self.__acks_dropped = 0
+        self.__in_flight = collections.deque()
+        chain.add_commit_listener(self.__on_commit)
+
+    async def add_transaction(self, s, r, v):
+        '''
+        Submits a transaction to the chain
+
+        Parameters
+        ----------
+        s : str
+            Sender of the coins.
+        r : str
+            Receiver of the coins.
+        v : float
+            Value of the coins transacted.
 
         Returns
         -------
-        None.
+        Future
+            resolves to (block seq_id, tx_hash) when the block holding the
+            transaction is committed.
 
         '''
-        
-        self.__name = name.upper()
-        self.__chain = []
-        self.__id = calc_hash(str(uuid.uuid4()) + self.__name + str(dt.datetime.now()))
-        self.__seq_id = 0
-        self.__prev_hash = None
-        self.__current_block = Block(self.__seq_id, None)
-        print(self.__name,'PandasChain created with ID',self.__id,'chain started.')
-    
-    def display_chain(self): 
+
+        future = self.__loop.create_future()
+        if not self.__batch:
+            self.__loop.call_soon(self.__submit_batch)
+        self.__batch.append((s, r, v, future))
+        return future
+
+    def __submit_batch(self):
         '''
-        Displays the complete blockchain
+        Hands the transactions submitted in this loop tick to the worker
+        thread. Does nothing if flush already submitted them.
 
         Returns
         -------
         None.
 
         '''
-        
-        for block in self.__chain:
-            block.display_transactions()
-        self.__current_block.display_transactions()
-    
-    def add_transaction(self, s, r, v): 
+
+        if not self.__batch:
+            return
+        batch, self.__batch = self.__batch, []
+        senders, receivers, values, futures = zip(*batch)
+        self.__in_flight.append(self.__acks_dropped + len(self.__acks))
+        task = self.__loop.run_in_executor(self.__executor, self.__chain.add_transactions, senders, receivers, values)
+        task.add_done_callback(lambda task: self.__on_hashed(task, futures))
+
+    def __on_hashed(self, task, futures):
         '''
-        Adds a transaction to the blockchain
+        Waits for the commit of a hashed batch, or fails its futures
 
         Parameters
         ----------
-        s : str
-            Sender of the coins.
-        r : str
-            Receiver of the coins.
-        v : float
-            Value of the coins transacted.
+        task : Future
+            add_transactions call of the batch.
+        futures : tuple of Future
+            futures of the transactions in the batch.
 
         Returns
         -------
         None.
 
         '''
-        
-        if self.__current_block.get_size() >= 10:
-            self.__commit_block(self.__current_block)
-        self.__current_block.add_transaction(s, r, v)
-    
-    def __commit_block(self,block): 
+
+        first_ack = self.__in_flight.popleft()
+        if task.exception() is not None:
+            for future in futures:
+                future.set_exception(task.exception())
+        else:
+            committed = {}
+            for seq_id, tx_hashes in itertools.islice(self.__acks, first_ack - self.__acks_dropped, None):
+                committed.update(dict.fromkeys(tx_hashes, seq_id))
+            for tx_hash, future in zip(task.result(), futures):
+                if tx_hash in committed:
+                    future.set_result((committed[tx_hash], tx_hash))
+                else:
+                    self.__waiting.setdefault(tx_hash, []).append(future)
+        # batches finish in submission order on the single worker, so no
+        # later batch needs the acknowledgements older than the next one
+        oldest = self.__in_flight[0] if self.__in_flight else self.__acks_dropped + len(self.__acks)
+        while self.__acks_dropped < oldest:
+            self.__acks.popleft()
+            self.__acks_dropped += 1
+
+    def __on_commit(self, block):
         '''
-        Commits the current block to the chain and creates a new block
+        Commit listener: passes the committed transactions to the loop
 
         Parameters
         ----------
         block : Block
-            Current block to be committed to the chain.
+            committed block.
 
         Returns
         -------
@@ -114,20 +5543,21 @@ class PandasChain:
 
         '''
 
-        ts = dt.datetime.now()
-        merkle_hash = block.get_simple_merkle_root()
-        block_hash = calc_hash(str(self.__prev_hash) + str(self.__id) + str(ts) + str(self.__seq_id) + str(np.random.randint(100)) + str(merkle_hash))
-        block.set_block_hash(block_hash)
-        block.set_status('COMMITTED')
-        self.__chain.append(block)
-        self.__seq_id += 1
-        self.__prev_hash = block_hash
-        self.__current_block = Block(self.__seq_id, self.__prev_hash)
-        print('Block committed')
-    
-    def display_block_headers(self): 
+        tx_hashes = [digest.hex() for digest in block.get_tx_digests()]
+        self.__loop.call_soon_threadsafe(self.__acknowledge, block.get_header()['seq_id'], tx_hashes)
+
+    def __acknowledge(self, seq_id, tx_hashes):
         '''
-        Displays the metadata for each block
+        Resolves the futures of committed transactions. While batches are
+        being hashed the block is logged, and dropped once every batch
+        submitted before it has finished.
+
+        Parameters
+        ----------
+        seq_id : int
+            sequence id of the committed block.
+        tx_hashes : list of str
+            hashes of the transactions in the block.
 
         Returns
         -------
@@ -135,55 +5565,66 @@ class PandasChain:
 
         '''
 
-        for block in self.__chain:
-            block.display_header()
-        self.__current_block.display_header()
-    
-    def get_number_of_blocks(self): 
+        for tx_hash in tx_hashes:
+            for future in self.__waiting.pop(tx_hash, ()):
+                if not future.done():
+                    future.set_result((seq_id, tx_hash))
+        if self.__in_flight:
+            self.__acks.append((seq_id, tx_hashes))
+
+    async def flush(self):
         '''
-        Returns the number of blocks in the chain
+        Submits pending transactions and seals and commits the current block
 
         Returns
         -------
-        int
-            Number of blocks in the chain.
+        None.
 
         '''
 
-        return len(self.__chain) + 1
-    
-    def get_values(self):
+        if self.__batch:
+            self.__submit_batch()
+        await self.__loop.run_in_executor(self.__executor, self.__chain.flush)
+
+    async def close(self):
         '''
-        Returns a list of coin values in each transaction in the chain
+        Flushes the chain and stops listening for its commits
 
         Returns
         -------
-        value_list : list
-            List of coin values transacted.
+        None.
 
         '''
-        
-        value_list = []
-        for block in self.__chain:
-            value_list.append(block.get_values())
-        value_list.append(self.__current_block.get_values())
-        return value_list
 
-class Block:
+        await self.flush()
+        self.__chain.remove_commit_listener(self.__on_commit)
+        self.__executor.shutdown()
+
+class ShardedPandasChain:
     '''
-    Class representing a block of transactions in a blockchain.
+    N independent PandasChains, each in its own process, behind one front
+    end. A transaction goes to the shard picked by the crc32 of its sender,
+    so all of a sender's transactions stay in one chain, and queries fan out
+    to every shard before the results are merged. add_transactions sends
+    every shard its slice before waiting for any of them, so batches are
+    hashed and committed on all shards in parallel.
     '''
 
-    def __init__(self,seq_id,prev_hash): 
+    def __init__(self, name, shards=None, path=None, **options):
         '''
-        Constructor for the Block class
+        Constructor of the ShardedPandasChain class
 
         Parameters
         ----------
-        seq_id : int
-            Sequence number for the block.
-        prev_hash : str
-            hash of the previous block in the chain.
+        name : str
+            name of the blockchain, shard i is named name-i.
+        shards : int, optional
+            number of shards. The default is None, which uses every CPU.
+        path : str, optional
+            directory holding one segment store per shard in shard-i. The
+            default is None, which keeps the shards in memory.
+        **options :
+            other keyword arguments of PandasChain for every shard.
 
         Returns
         -------
@@ -191,30 +5632,79 @@ class Block:
 
         '''
 
-        self.__seq_id = seq_id
-        self.__prev_hash = prev_hash
-        self.__col_names = ['Timestamp','Sender','Receiver','Value','TxHash']
-        self.__transactions = pd.DataFrame(columns = self.__col_names)
-        self.__status = 'UNCOMMITTED'
-        self.__block_hash = None
-        self.__merkle_tx_hash = None
-        
-    def display_header(self): 
+        self.__shards = shards or os.cpu_count() or 1
+        context = multiprocessing.get_context()
+        self.__conns = []
+        self.__workers = []
+        for i in range(self.__shards):
+            parent, child = context.Pipe()
+            shard_options = dict(options)
+            if path is not None:
+                shard_options['path'] = os.path.join(path, 'shard-' + str(i))
+            worker = context.Process(target=run_shard, args=(name + '-' + str(i), shard_options, child),
+                                     name=name + '-shard-' + str(i), daemon=True)
+            worker.start()
+            child.close()
+            self.__conns.append(parent)
+            self.__workers.append(worker)
+
+    def shard_of(self, s):
         '''
-        Displays the metadata for this block
+        Returns the shard of a sender
+
+        Parameters
+        ----------
+        s : str
+            Sender of the coins.
 
         Returns
         -------
-        None.
+        int
+            index of the shard.
 
         '''
-        print("{seq_id}, {status}, {block_hash}, {prev_hash}, {merkle}, {trans_count}".format( \
-            seq_id = self.__seq_id, status = self.__status, block_hash = self.__block_hash, \
-            prev_hash = self.__prev_hash, merkle = self.__merkle_tx_hash, trans_count = self.get_size()))
-    
-    def add_transaction(self, s, r, v): 
+
+        return zlib.crc32(str(s).encode('utf-8')) % self.__shards
+
+    def __call(self, shards, method, *args):
+        '''
+        Sends a request to some shards, then collects their answers
+
+        Parameters
+        ----------
+        shards : dict
+            args of the request by shard index, or None to send args to every
+            shard.
+        method : str
+            PandasChain method to call.
+        *args :
+            arguments of the method when shards is None.
+
+        Returns
+        -------
+        dict
+            result by shard index.
+
         '''
-        Adds a transaction to the block
+
+        if shards is None:
+            shards = dict.fromkeys(range(self.__shards), args)
+        for i, shard_args in shards.items():
+            self.__conns[i].send((method, shard_args))
+        results, error = {}, None
+        for i in shards:
+            status, result = self.__conns[i].recv()
+            if status == 'error':
+                error = error or result
+            else:
+                results[i] = result
+        if error is not None:
+            raise error
+        return results
+
+    def add_transaction(self, s, r, v):
+        '''
+        Adds a transaction to the shard of its sender
 
         Parameters
         ----------
@@ -227,101 +5717,334 @@ class Block:
 
         Returns
         -------
-        None.
+        str
+            hash of the transaction.
 
         '''
 
-        ts = dt.datetime.now()
-        tx_hash = calc_hash(str(ts) + str(s) + str(r) + str(v))
-        new_transaction = pd.DataFrame(data=[{self.__col_names[0]:ts, self.__col_names[1]:s, self.__col_names[2]:r, self.__col_names[3]:v, self.__col_names[4]:tx_hash}])
-        self.__transactions = self.__transactions.append(new_transaction)
-        self.__merkle_tx_hash = calc_hash(self.__transactions['TxHash'].str.cat())
-        
-    def display_transactions(self): 
+        shard = self.shard_of(s)
+        return self.__call({shard: (s, r, v)}, 'add_transaction')[shard]
+
+    def add_transactions(self, senders, receivers=None, values=None):
         '''
-        Displays the transactions in the block
+        Adds many transactions, every shard adding its slice in parallel
+
+        Parameters
+        ----------
+        senders : list, ndarray or DataFrame
+            Senders of the coins, or a DataFrame with Sender, Receiver and
+            Value columns.
+        receivers : list or ndarray, optional
+            Receivers of the coins. Not used with a DataFrame.
+        values : list or ndarray, optional
+            Values of the coins transacted. Not used with a DataFrame.
 
         Returns
         -------
-        None.
+        list of str
+            hashes of the transactions, in input order.
 
         '''
 
-        self.display_header()
-        print(self.__transactions[['Timestamp','Sender','Receiver','Value']].to_string(index = False))
-    
-    def get_size(self): 
+        if isinstance(senders, pd.DataFrame):
+            senders, receivers, values = senders['Sender'], senders['Receiver'], senders['Value']
+        senders, receivers, values = (x.tolist() if hasattr(x, 'tolist') else list(x)
+                                      for x in (senders, receivers, values))
+        rows = collections.defaultdict(list)
+        for i, s in enumerate(senders):
+            rows[self.shard_of(s)].append(i)
+        results = self.__call({shard: ([senders[i] for i in shard_rows], [receivers[i] for i in shard_rows],
+                                       [values[i] for i in shard_rows])
+                               for shard, shard_rows in rows.items()}, 'add_transactions')
+        tx_hashes = [None] * len(senders)
+        for shard, shard_rows in rows.items():
+            for i, tx_hash in zip(shard_rows, results[shard]):
+                tx_hashes[i] = tx_hash
+        return tx_hashes
+
+    def get_transaction(self, tx_hash):
         '''
-        Returns the number of transactions in the block
+        Looks up a transaction in every shard
+
+        Parameters
+        ----------
+        tx_hash : str
+            hash of the transaction.
+
+        Returns
+        -------
+        dict
+            the transaction with the Shard and SeqId of its block, or None.
+
+        '''
+
+        for shard, transaction in self.__call(None, 'get_transaction', tx_hash).items():
+            if transaction is not None:
+                transaction['Shard'] = shard
+                return transaction
+        return None
+
+    def get_number_of_blocks(self):
+        '''
+        Returns the number of blocks over all shards
 
         Returns
         -------
         int
-            Number of tranactions in the block.
+            Number of blocks in the shards.
 
         '''
 
-        return self.__transactions.shape[0]
-    
-    def set_status(self, status):
+        return sum(self.__call(None, 'get_number_of_blocks').values())
+
+    def get_values(self, timestamps=False):
         '''
-        Sets the status of the block
+        Returns the coin values of every transaction in every shard
 
         Parameters
         ----------
-        status : str
-            Sets the block status.
+        timestamps : bool, optional
+            also return the transaction times, and order the values by time
+            instead of by shard. The default is False.
 
         Returns
         -------
-        None.
+        ndarray or tuple
+            float64 values, or (values, datetime64[ns] times).
 
         '''
-        
-        self.__status = status
-    
-    def set_block_hash(self, hash):
+
+        results = [result for _, result in sorted(self.__call(None, 'get_values', timestamps).items())]
+        if not timestamps:
+            return np.concatenate(results)
+        values = np.concatenate([result[0] for result in results])
+        times = np.concatenate([result[1] for result in results])
+        order = np.argsort(times, kind='stable')
+        return values[order], times[order]
+
+    def get_balance(self, party):
         '''
-        Sets the block hash
+        Returns the balance of a party summed over the shards
 
         Parameters
         ----------
-        hash : str
-            calculated hash of the block.
+        party : str
+            sender or receiver.
 
         Returns
         -------
-        None.
+        float
+            coins received minus coins sent.
 
         '''
 
-        self.__block_hash = hash
-    
-    def get_simple_merkle_root(self): 
+        return sum(self.__call(None, 'get_balance', party).values())
+
+    def get_balances(self):
         '''
-        Returns the simple merkle root hash of the transactions in the block
+        Returns the balance of every party summed over the shards
 
         Returns
         -------
-        str
-            simple merkle root hash of the transactions in the block.
+        dict
+            balance by party.
 
         '''
 
-        return self.__merkle_tx_hash
-    
-    def get_values(self):
+        balances = {}
+        for shard_balances in self.__call(None, 'get_balances').values():
+            for party, balance in shard_balances.items():
+                balances[party] = balances.get(party, 0.0) + balance
+        return balances
+
+    def top_balances(self, k):
         '''
-        Returns a list of coin values in the transactions of the block
+        Returns the parties with the highest balances over all shards. A
+        receiver can be credited in every shard, so the full balances are
+        merged before ranking.
+
+        Parameters
+        ----------
+        k : int
+            number of parties to return.
 
         Returns
         -------
-        list
-            list of coin values in the transactions of the block.
+        list of tuple
+            (party, balance) pairs, highest balance first.
 
         '''
-        
-        return self.__transactions['value'].tolist()
+
+        return heapq.nlargest(k, self.get_balances().items(), key=lambda item: item[1])
+
+    def flush(self):
+        '''
+        Flushes every shard
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        self.__call(None, 'flush')
+
+    def close(self):
+        '''
+        Closes every shard and waits for the shard processes to exit
+
+        Returns
+        -------
+        None.
+
+        '''
+
+        for conn in self.__conns:
+            conn.send(None)
+        for conn, worker in zip(self.__conns, self.__workers):
+            worker.join()
+            conn.close()
+        self.__conns, self.__workers = [], []
+
+def generate_transactions(n, parties=1000, skew=1.2, seed=0):
+    '''
+    Generates synthetic transactions. Senders and receivers are drawn from a
+    Zipf distribution over the parties, so a few parties are very active and
+    most are rare, and values are log-normal and rounded to cents.
+
+    Parameters
+    ----------
+    n : int
+        number of transactions.
+    parties : int, optional
+        number of distinct parties. The default is 1000.
+    skew : float, optional
+        Zipf exponent, must be greater than 1. The default is 1.2.
+    seed : int, optional
+        random seed. The default is 0.
+
+    Returns
+    -------
+    tuple
+        (senders, receivers, values) arrays.
+
+    '''
+
+    rng = np.random.default_rng(seed)
+    names = np.array(['Party' + str(i) for i in range(parties)])
+    senders = names[(rng.zipf(skew, n) - 1) % parties]
+    receivers = names[(rng.zipf(skew, n) - 1) % parties]
+    values = np.round(rng.lognormal(3.0, 1.5, n), 2)
+    return senders, receivers, values
+
+def run_benchmark(block_size, transactions=None, parties=1000, windows=10):
+    '''
+    Benchmarks one in-memory PandasChain that commits every block_size
+    transactions. Reports add_transaction throughput for each window of the
+    run against the chain length, the latency of the calls that committed a
+    block, traced memory per transaction, and the cost of get_values,
+    display_block_headers and of the merkle root of one full block. Memory
+    is traced in a separate untimed pass that builds the same chain with
+    add_transactions, so tracing does not slow down the timed calls.
+
+    Parameters
+    ----------
+    block_size : int
+        transactions per block.
+    transactions : int, optional
+        transactions to add. The default is enough for three blocks and at
+        least 20000.
+    parties : int, optional
+        number of distinct parties. The default is 1000.
+    windows : int, optional
+        number of throughput samples. The default is 10.
+
+    Returns
+    -------
+    dict
+        results of the run.
+
+    '''
+
+    n = transactions or max(20000, 3 * block_size)
+    senders, receivers, values = generate_transactions(n, parties)
+    senders, receivers, values = senders.tolist(), receivers.tolist(), values.tolist()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        tracemalloc.start()
+        pandas_chain = PandasChain('bench', policy=CommitPolicy(max_transactions=block_size))
+        base = tracemalloc.get_traced_memory()[0]
+        pandas_chain.add_transactions(senders, receivers, values)
+        memory = tracemalloc.get_traced_memory()[0] - base
+        tracemalloc.stop()
+        del pandas_chain
+
+        pandas_chain = PandasChain('bench', policy=CommitPolicy(max_transactions=block_size))
+        throughput, latencies = [], []
+        step = max(1, n // windows)
+        blocks = pandas_chain.get_number_of_blocks()
+        for start in range(0, n, step):
+            window = time.perf_counter()
+            for i in range(start, min(start + step, n)):
+                begin = time.perf_counter()
+                pandas_chain.add_transaction(senders[i], receivers[i], values[i])
+                if pandas_chain.get_number_of_blocks() != blocks:
+                    latencies.append(time.perf_counter() - begin)
+                    blocks = pandas_chain.get_number_of_blocks()
+            throughput.append({'chain_length': i + 1,
+                               'tx_per_sec': (i + 1 - start) / (time.perf_counter() - window)})
+
+        begin = time.perf_counter()
+        pandas_chain.get_values()
+        get_values = time.perf_counter() - begin
+        begin = time.perf_counter()
+        pandas_chain.display_block_headers()
+        headers = time.perf_counter() - begin
+    leaves = [hashlib.sha256(str(i).encode()).digest() for i in range(block_size)]
+    begin = time.perf_counter()
+    merkle_root(leaves)
+    merkle = time.perf_counter() - begin
+
+    latencies = np.array(latencies or [0.0]) * 1000
+    return {'block_size': block_size, 'transactions': n, 'parties': parties,
+            'blocks': pandas_chain.get_number_of_blocks(), 'throughput': throughput,
+            'commit_latency_ms': {'p50': float(np.percentile(latencies, 50)),
+                                  'p90': float(np.percentile(latencies, 90)),
+                                  'p99': float(np.percentile(latencies, 99)),
+                                  'max': float(latencies.max())},
+            'bytes_per_transaction': memory / n, 'get_values_s': get_values,
+            'display_block_headers_s': headers, 'merkle_root_s': merkle}
+
+def run_benchmarks(path=None, block_sizes=(10, 1000, 100000), transactions=None, parties=1000):
+    '''
+    Runs run_benchmark for each block size and optionally writes the results
+    as JSON together with the library versions, so runs can be compared
+    between versions of the chain.
+
+    Parameters
+    ----------
+    path : str, optional
+        JSON file to write. The default is None.
+    block_sizes : tuple, optional
+        block sizes to benchmark. The default is (10, 1000, 100000).
+    transactions : int, optional
+        transactions per run, see run_benchmark. The default is None.
+    parties : int, optional
+        number of distinct parties. The default is 1000.
+
+    Returns
+    -------
+    dict
+        environment and per block size results.
+
+    '''
+
+    results = {'created': dt.datetime.now().isoformat(), 'python': sys.version.split()[0],
+               'numpy': np.__version__, 'pandas': pd.__version__,
+               'runs': [run_benchmark(size, transactions, parties) for size in block_sizes]}
+    if path is not None:
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
 
 class TestAssignment4(unittest.TestCase):
     def test_chain(self):
@@ -356,42 +6079,504 @@ class TestAssignment4(unittest.TestCase):
         pandas_chain.add_transaction("Bob","Alice",53)
         self.assertEqual(pandas_chain.get_number_of_blocks(),3)
 
+    def test_block_buffers(self):
+        block = Block(0,None,capacity=2)
+        for v in range(25):
+            block.add_transaction("Bob","Alice",v)
+        self.assertEqual(block.get_size(),25)
+        self.assertEqual(block.get_values().tolist(),[float(v) for v in range(25)])
+
+    def test_merkle_root(self):
+        leaves = [hashlib.sha256(bytes([i])).digest() for i in range(7)]
+        left = merkle_parent(merkle_parent(leaves[0],leaves[1]),merkle_parent(leaves[2],leaves[3]))
+        right = merkle_parent(merkle_parent(leaves[4],leaves[5]),leaves[6])
+        self.assertEqual(merkle_root(leaves),merkle_parent(left,right))
+        frontier = []
+        for leaf in leaves:
+            root = merkle_append(frontier,leaf)
+        self.assertEqual(root,merkle_root(leaves))
+
+    def test_proofs(self):
+        pandas_chain = PandasChain('testnet')
+        tx_hashes = [pandas_chain.add_transaction("Bob","Alice",v) for v in range(25)]
+        proofs = [pandas_chain.get_proof(h) for h in tx_hashes[:20]]
+        self.assertEqual(verify_proofs(proofs),[True] * 20)
+        self.assertIsNone(pandas_chain.get_proof(tx_hashes[-1]))
+        proofs[3]['path'][0] = proofs[4]['path'][0]
+        self.assertFalse(verify_proofs(proofs[3:4])[0])
+        leaves = [hashlib.sha256(str(i).encode()).digest() for i in range(13)]
+        tree = merkle_tree(leaves)
+        self.assertEqual(tree[2][0],merkle_root(leaves))
+        self.assertEqual(merkle_proof(leaves,11,tree),[leaves[10],merkle_root(leaves[8:10]),leaves[12],merkle_root(leaves[:8])])
+
+    def test_get_transaction(self):
+        pandas_chain = PandasChain('testnet')
+        tx_hashes = [pandas_chain.add_transaction("Bob","Alice",v) for v in range(25)]
+        transaction = pandas_chain.get_transaction(tx_hashes[13])
+        self.assertEqual((transaction['SeqId'],transaction['Value']),(1,13.0))
+        self.assertEqual(pandas_chain.get_transaction(tx_hashes[24])['SeqId'],2)
+        self.assertIsNone(pandas_chain.get_transaction(calc_hash('missing')))
+        pandas_chain.INDEX_MERGE_ROWS = 4
+        pandas_chain.INDEX_RUN_ROWS = 16
+        tx_hashes += pandas_chain.add_transactions(["Carol"] * 30,["Bob"] * 30,range(30))
+        self.assertEqual([pandas_chain.get_transaction(tx_hash)['Value'] for tx_hash in tx_hashes],
+                         list(map(float, range(25))) + list(map(float, range(30))))
+
+    def test_validate(self):
+        pandas_chain = PandasChain('testnet')
+        for v in range(95):
+            pandas_chain.add_transaction("Bob","Alice",v)
+        self.assertIsNone(pandas_chain.validate(processes=2))
+        pandas_chain._PandasChain__chain[4].set_block_hash(calc_hash('forged'))
+        self.assertEqual(pandas_chain.validate(processes=2),5)
+        self.assertEqual(pandas_chain.validate(processes=1),5)
+
+    def test_add_transactions(self):
+        pandas_chain = PandasChain('testnet')
+        pandas_chain.add_transaction("Bob","Alice",1)
+        tx_hashes = pandas_chain.add_transactions(np.array(["Bob"] * 24),["Alice"] * 24,np.arange(24.0))
+        self.assertEqual(pandas_chain.get_number_of_blocks(),3)
+        self.assertEqual(pandas_chain.get_transaction(tx_hashes[20])['SeqId'],2)
+        transaction = pandas_chain.get_transaction(tx_hashes[5])
+        self.assertEqual(tx_hashes[5],hash_transaction(transaction['Timestamp'].value,"Bob","Alice",5.0))
+        pandas_chain.add_transactions(pd.DataFrame({'Sender':["Carol"],'Receiver':["Bob"],'Value':[2.5]}))
+        self.assertIsNone(pandas_chain.validate(processes=1))
+        tx_hashes = pandas_chain.add_transactions(["Dan"] * 3,["Eve"] * 3,[1,1,1]) + [pandas_chain.add_transaction("Dan","Eve",1)]
+        self.assertEqual(len(set(tx_hashes)),4)
+        timestamps = [pandas_chain.get_transaction(tx_hash)['Timestamp'] for tx_hash in tx_hashes]
+        self.assertEqual(timestamps,sorted(set(timestamps)))
+
+    def test_commit_policy(self):
+        pandas_chain = PandasChain('testnet',policy=CommitPolicy(max_transactions=100,max_bytes=5 * Block.TX_BYTES))
+        pandas_chain.add_transactions(["Bob"] * 12,["Alice"] * 12,range(12))
+        self.assertEqual(pandas_chain.get_number_of_blocks(),3)
+        pandas_chain = PandasChain('testnet',policy=CommitPolicy(max_transactions=4),background=True)
+        for v in range(10):
+            pandas_chain.add_transaction("Bob","Alice",v)
+        pandas_chain.flush()
+        self.assertEqual(pandas_chain.get_number_of_blocks(),4)
+        self.assertIsNone(pandas_chain.validate(processes=1))
+        pandas_chain = PandasChain('testnet',policy=CommitPolicy(max_age=0.05),background=True)
+        pandas_chain.add_transaction("Bob","Alice",1)
+        time.sleep(0.3)
+        self.assertEqual(pandas_chain.get_number_of_blocks(),2)
+        pandas_chain.close()
+        pandas_chain = PandasChain('testnet',policy=CommitPolicy(max_transactions=2),background=True)
+        pandas_chain.add_commit_listener(lambda block: time.sleep(0.2))
+        pandas_chain.add_transactions(["Bob"] * 4,["Alice"] * 4,[1,2,3,4])
+        time.sleep(0.1)
+        self.assertEqual(pandas_chain.get_number_of_blocks(),3)
+        self.assertEqual(list(pandas_chain.get_values()),[1,2,3,4])
+        pandas_chain.close()
+
+    def test_mempool(self):
+        pandas_chain = PandasChain('testnet')
+        mempool = Mempool(pandas_chain,capacity=50,batch_size=7)
+        producers = [threading.Thread(target=lambda p=p: [mempool.submit("P" + str(p),"Alice",p * 1000 + v) for v in range(250)])
+                     for p in range(4)]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        mempool.close()
+        self.assertEqual(mempool.stats()['sequenced'],1000)
+        self.assertEqual(mempool.stats()['depth'],0)
+        values = pandas_chain.get_values().tolist()
+        for p in range(4):
+            self.assertEqual([v for v in values if v // 1000 == p],[p * 1000.0 + v for v in range(250)])
+        self.assertEqual(pandas_chain.get_number_of_blocks(),100)
+        mempool = Mempool(PandasChain('testnet'),capacity=1,batch_size=1)
+        mempool.submit("Bob","Alice","abc")
+        mempool.submit("Bob","Alice",1,timeout=5)
+        mempool.submit("Bob","Alice",2,timeout=5)
+        with self.assertRaises(ValueError):
+            mempool.close()
+        self.assertEqual(mempool.stats()['sequenced'],2)
+        self.assertEqual(mempool.stats()['failed'],1)
+
+    def test_async_chain(self):
+        async def submit():
+            async_chain = AsyncPandasChain(PandasChain('testnet'))
+            futures = await asyncio.gather(*(async_chain.add_transaction("Bob","Alice",v) for v in range(25)))
+            await async_chain.flush()
+            acks = await asyncio.gather(*futures)
+            for v in range(5):
+                futures += [await async_chain.add_transaction("Bob","Alice",v) for _ in range(3)]
+                await asyncio.sleep(0)
+            await async_chain.flush()
+            acks += await asyncio.gather(*futures[25:])
+            await async_chain.close()
+            return acks
+        acks = asyncio.run(submit())
+        self.assertEqual([seq_id for seq_id, tx_hash in acks],[0] * 10 + [1] * 10 + [2] * 5 + [3] * 10 + [4] * 5)
+
+        async def flush_at_once():
+            async_chain = AsyncPandasChain(PandasChain('testnet'))
+            future = await async_chain.add_transaction("Bob","Alice",1)
+            await async_chain.flush()
+            ack = await future
+            await asyncio.sleep(0)
+            await async_chain.close()
+            return ack
+        with self.assertNoLogs('asyncio',level='ERROR'):
+            self.assertEqual(asyncio.run(flush_at_once())[0],0)
+
+    def test_balances(self):
+        pandas_chain = PandasChain('testnet')
+        pandas_chain.add_transaction("Bob","Alice",50)
+        pandas_chain.add_transactions(["Alice","Carol"] * 10,["Carol","Bob"] * 10,[5,2] * 10)
+        self.assertEqual(pandas_chain.get_balance("Alice"),0.0)
+        self.assertEqual(pandas_chain.get_balance("Bob"),-30.0)
+        self.assertEqual(pandas_chain.top_balances(2),[("Carol",30.0),("Alice",0.0)])
+        self.assertTrue(pandas_chain.check_balances())
+        pandas_chain.add_transaction("Carol","Bob","5")
+        pandas_chain.add_transactions(["Carol"],["Bob"],["2.5"])
+        self.assertEqual(pandas_chain.get_balance("Bob"),-22.5)
+        self.assertTrue(pandas_chain.check_balances())
+        with self.assertRaises(ValueError):
+            pandas_chain.add_transaction("Carol","Bob","five")
+        self.assertEqual(pandas_chain.get_values().size,23)
+
+    def test_get_values(self):
+        pandas_chain = PandasChain('testnet')
+        pandas_chain.add_transactions(["Bob"] * 25,["Alice"] * 25,range(25))
+        values, timestamps = pandas_chain.get_values(timestamps=True)
+        self.assertEqual(values.dtype,np.float64)
+        self.assertEqual(values.tolist(),list(range(25)))
+        self.assertEqual(timestamps.dtype,np.dtype('datetime64[ns]'))
+        self.assertEqual([block.size for block in pandas_chain.iter_values()],[10,10,5])
+
+    def test_query_range(self):
+        pandas_chain = PandasChain('testnet')
+        for v in range(25):
+            pandas_chain.add_transaction("Bob","Alice",v)
+        values, timestamps = pandas_chain.get_values(timestamps=True)
+        result = pandas_chain.query_range(timestamps[8],timestamps[22])
+        expected = (timestamps >= timestamps[8]) & (timestamps < timestamps[22])
+        self.assertEqual(result['Value'].tolist(),values[expected].tolist())
+        self.assertEqual(result['SeqId'].tolist(),(np.flatnonzero(expected) // 10).tolist())
+        self.assertEqual(len(pandas_chain.query_range('1999-01-01','2000-01-01')),0)
+
+    def test_proof_of_work(self):
+        pandas_chain = PandasChain('testnet',difficulty=8,mining_processes=2)
+        tx_hashes = [pandas_chain.add_transaction("Bob","Alice",v) for v in range(11)]
+        pandas_chain.set_difficulty(4)
+        pandas_chain.flush()
+        self.assertEqual(int(pandas_chain.get_proof(tx_hashes[0])['header']['block_hash'],16) >> 248,0)
+        self.assertEqual(int(pandas_chain.get_proof(tx_hashes[10])['header']['block_hash'],16) >> 252,0)
+        stats = pandas_chain.mining_stats()
+        self.assertEqual(sorted(stats),[4,8])
+        self.assertEqual(stats[8]['blocks'],1)
+        self.assertGreater(stats[8]['hashes'],0)
+        pandas_chain.close()
+        with NonceMiner(2) as miner:
+            for difficulty in (4, 6):
+                nonce, tried = miner.mine(b'prefix', b'suffix', difficulty)
+                self.assertEqual(hashlib.sha256(b'prefix' + BLOCK_NONCE.pack(nonce) + b'suffix').digest()[0] >> (8 - difficulty),0)
+
+    def test_party_dictionary(self):
+        parties = PartyDictionary()
+        block = Block(0,None,parties=parties)
+        tx_hash = block.add_transaction("Bob","Alice",5)
+        block.add_transactions(["Alice","Carol"],["Bob","Bob"],[1,2])
+        self.assertEqual(parties.get_names(),["Bob","Alice","Carol"])
+        self.assertEqual(block.get_columns()[2].tolist(),[0,1,2])
+        self.assertEqual(block.get_columns()[2].dtype,np.int32)
+        transaction = block.get_transaction(0)
+        self.assertEqual(tx_hash,hash_transaction(transaction['Timestamp'].value,"Bob","Alice",5))
+
+    def test_checkpoint(self):
+        with tempfile.TemporaryDirectory() as path:
+            snapshot = os.path.join(path,'chain.npz')
+            pandas_chain = PandasChain('testnet')
+            tx_hashes = pandas_chain.add_transactions(["Bob","Carol"] * 12,["Alice"] * 24,range(24))
+            pandas_chain.checkpoint(snapshot)
+            restored = PandasChain.restore(snapshot)
+            self.assertEqual(restored.get_number_of_blocks(),3)
+            self.assertEqual(restored.get_transaction(tx_hashes[23])['Sender'],"Carol")
+            restored.add_transactions(["Bob"] * 7,["Alice"] * 7,[1] * 7)
+            self.assertEqual(restored.get_number_of_blocks(),4)
+            self.assertEqual(restored.get_balance("Alice"),sum(range(24)) + 7)
+            self.assertIsNone(restored.validate(processes=1))
+            store = os.path.join(path,'store')
+            pandas_chain = PandasChain('testnet',store)
+            tx_hashes = pandas_chain.add_transactions(["Bob"] * 25,["Alice"] * 25,range(25))
+            pandas_chain.checkpoint(snapshot)
+            tx_hashes += pandas_chain.add_transactions(["Carol"] * 10,["Alice"] * 10,[1] * 10)
+            pandas_chain.close()
+            restored = PandasChain.restore(snapshot,store)
+            self.assertEqual(restored.get_number_of_blocks(),5)
+            self.assertEqual(restored.get_transaction(tx_hashes[3])['SeqId'],0)
+            self.assertEqual(restored.get_transaction(tx_hashes[30])['SeqId'],3)
+            self.assertEqual(restored.get_balance("Alice"),sum(range(25)) + 10)
+            self.assertTrue(restored.check_balances())
+            restored.close()
+            flushed = PandasChain('testnet')
+            flushed.add_transactions(["Bob"] * 5,["Alice"] * 5,range(5))
+            for pandas_chain in (PandasChain('testnet'),flushed):
+                pandas_chain.flush()
+                pandas_chain.checkpoint(snapshot)
+                empty = PandasChain.restore(snapshot)
+                tx_hash = empty.add_transaction("Bob","Alice",3)
+                self.assertEqual(empty.get_transaction(tx_hash)['Value'],3.0)
+
+    def test_export(self):
+        pandas_chain = PandasChain('testnet')
+        tx_hashes = pandas_chain.add_transactions(["Bob","Carol"] * 12,["Alice"] * 24,range(24))
+        with tempfile.TemporaryDirectory() as path:
+            pandas_chain.export(os.path.join(path,'chain.npz'),chunk_rows=15)
+            with np.load(os.path.join(path,'chain.npz')) as data:
+                self.assertEqual(data['value'].tolist(),list(range(24)))
+                self.assertEqual(data['parties'][data['sender'][:2]].tolist(),["Bob","Carol"])
+                self.assertEqual(data['tx_hash'][23].tobytes().hex(),tx_hashes[23])
+                self.assertEqual(data['seq_id'].tolist(),[0] * 10 + [1] * 10 + [2] * 4)
+                self.assertEqual(data['block_status'].tolist(),[b'COMMITTED',b'COMMITTED',b'UNCOMMITTED'])
+            if pa is not None:
+                pandas_chain.export(os.path.join(path,'chain.parquet'),format='parquet',chunk_rows=15)
+                table = pq.read_table(os.path.join(path,'chain.parquet')).to_pandas()
+                self.assertEqual(table['Sender'].tolist()[:2],["Bob","Carol"])
+                self.assertEqual(len(pq.read_table(os.path.join(path,'chain.blocks.parquet'))),3)
+
+    def test_benchmark(self):
+        senders, receivers, values = generate_transactions(500, parties=20)
+        self.assertTrue(set(senders) <= {'Party' + str(i) for i in range(20)})
+        self.assertGreater((senders == 'Party0').sum(), (senders == 'Party10').sum())
+        with tempfile.TemporaryDirectory() as path:
+            run_benchmarks(os.path.join(path,'bench.json'),block_sizes=(10,),transactions=100,parties=20)
+            with open(os.path.join(path,'bench.json')) as f:
+                run = json.load(f)['runs'][0]
+        self.assertEqual(run['blocks'],10)
+        self.assertEqual(run['throughput'][-1]['chain_length'],100)
+        self.assertGreater(run['commit_latency_ms']['max'],0)
+        self.assertGreater(run['bytes_per_transaction'],0)
+
+    def test_instruments(self):
+        pandas_chain = PandasChain('testnet')
+        self.assertIsNone(pandas_chain.stats())
+        stages = []
+        pandas_chain.set_instruments(callback=lambda stage, seconds, counts: stages.append(stage))
+        for v in range(11):
+            pandas_chain.add_transaction("Bob","Alice",v)
+        pandas_chain.add_transactions(["Bob"] * 5,["Alice"] * 5,range(5))
+        stats = pandas_chain.stats()
+        self.assertEqual(stats['counters']['transactions_added'],16)
+        self.assertEqual(stats['counters']['blocks_committed'],1)
+        self.assertEqual(stats['counters']['bytes_hashed'],16 * (16 + 5 + 7))
+        self.assertEqual(stats['stages']['hashing']['calls'],12)
+        self.assertEqual(stats['stages']['storage']['calls'],1)
+        self.assertIn('commit',stages)
+        pandas_chain.set_instruments(False)
+        pandas_chain.add_transaction("Bob","Alice",1)
+        self.assertIsNone(pandas_chain.stats())
+
+    def test_display(self):
+        pandas_chain = PandasChain('testnet')
+        for v in range(25):
+            pandas_chain.add_transaction("Bob" if v % 2 else "Carol","Alice",v)
+        out = io.StringIO()
+        pandas_chain.display_block_headers(tail=2,file=out)
+        self.assertEqual([line.split(', ')[0] for line in out.getvalue().splitlines()],['1','2'])
+        out = io.StringIO()
+        pandas_chain.display_chain(offset=8,limit=5,format='csv',file=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split(',')[1] for line in lines],['0','0','0','1','1','1','1'])
+        self.assertEqual([float(line.split(',')[5]) for line in lines if line[0] == 'T'],[8,9,10,11,12])
+        out = io.BytesIO()
+        pandas_chain.display_chain(start=1,format='binary',file=out)
+        out.seek(0)
+        blocks = ChainRenderer.read(out)
+        self.assertEqual([header['seq_id'] for header, _ in blocks],[1,2])
+        self.assertEqual(blocks[0][1]['Sender'].tolist()[:2],["Carol","Bob"])
+        self.assertEqual(blocks[1][1]['Value'].tolist(),[20,21,22,23,24])
+        self.assertEqual(blocks[0][1]['TxHash'][0],pandas_chain.get_transaction(blocks[0][1]['TxHash'][0])['TxHash'])
+        pandas_chain.flush()
+        out = io.StringIO()
+        pandas_chain.display_chain(start=3,file=out)
+        self.assertEqual(out.getvalue().splitlines()[0].split(', ')[:2],['3','UNCOMMITTED'])
+
+    def test_sharded_chain(self):
+        senders, receivers, values = generate_transactions(200, parties=30)
+        sharded = ShardedPandasChain('testnet',shards=3)
+        try:
+            tx_hashes = sharded.add_transactions(senders,receivers,values)
+            tx_hashes.append(sharded.add_transaction("Bob","Alice",5))
+            transaction = sharded.get_transaction(tx_hashes[7])
+            self.assertEqual(transaction['Sender'],senders[7])
+            self.assertEqual(transaction['Shard'],sharded.shard_of(senders[7]))
+            self.assertAlmostEqual(sharded.get_values().sum(),values.sum() + 5)
+            self.assertAlmostEqual(sum(sharded.get_balances().values()),0.0,places=6)
+            self.assertAlmostEqual(sharded.get_balance("Alice"),sum(v for r, v in zip(receivers,values) if r == "Alice") + 5)
+            top = sharded.top_balances(3)
+            self.assertEqual(top[0],max(sharded.get_balances().items(),key=lambda item: item[1]))
+            self.assertGreaterEqual(sharded.get_number_of_blocks(),201 // 10)
+            with self.assertRaises(ValueError):
+                sharded.get_transaction("missing")
+            self.assertEqual(sharded.get_transaction(tx_hashes[7])['Sender'],senders[7])
+        finally:
+            sharded.close()
+
+    def test_encoding(self):
+        data = encode_transaction(1649000000123456789,"Bob","Zoë",0.1) + encode_transaction(-5,"","Alice",-2.5)
+        first, offset = decode_transaction(data)
+        self.assertEqual(first,(1649000000123456789,"Bob","Zoë",0.1))
+        self.assertEqual(decode_transaction(data,offset),((-5,"","Alice",-2.5),len(data)))
+        self.assertEqual(hash_transaction(7,"Bob","Zoë",0.1),hashlib.sha256(encode_transaction(7,"Bob","Zoë",0.1)).hexdigest())
+        self.assertNotEqual(hash_transaction(7,"Bo","bAlice",1),hash_transaction(7,"Bob","Alice",1))
+        pandas_chain = PandasChain('testnet')
+        for v in range(11):
+            pandas_chain.add_transaction("Bob","Alice",v)
+        block = pandas_chain._PandasChain__chain[0]
+        for header in (block.get_header(),pandas_chain._PandasChain__current_block.get_header()):
+            encoded = encode_header(header)
+            self.assertEqual(decode_header(encoded + b'tail'),(header,len(encoded)))
+        header = block.get_header()
+        prefix = encode_block_prefix(None,pandas_chain._PandasChain__id,header['commit_ts'],0)
+        self.assertEqual(hash_block(prefix,header['nonce'],header['merkle_root']),header['block_hash'])
+
+    def test_replication(self):
+        primary = PandasChain('primary')
+        server = ReplicationServer(primary)
+        replica = PandasChain('replica')
+        follower = ChainFollower(replica,server.get_address(),retry=0.05)
+        try:
+            tx_hashes = primary.add_transactions(["Bob","Carol"] * 12,["Alice"] * 24,range(24))
+            self.assertTrue(follower.wait_for(2,timeout=10))
+            self.assertEqual(replica.get_transaction(tx_hashes[15])['Value'],15.0)
+            self.assertEqual(replica.get_balance("Alice"),sum(range(20)))
+            follower.close()
+            tx_hashes += primary.add_transactions(["Bob"] * 20,["Carol"] * 20,range(20))
+            follower = ChainFollower(replica,server.get_address(),retry=0.05)
+            self.assertTrue(follower.wait_for(4,timeout=10))
+            self.assertEqual(replica._PandasChain__chain[3].get_header(),primary._PandasChain__chain[3].get_header())
+            stats = follower.stats()
+            self.assertEqual((stats['blocks'],stats['lag_blocks'],stats['error']),(2,0,None))
+            self.assertTrue(0 <= stats['lag_seconds'] < 10)
+            self.assertGreaterEqual(server.stats()['blocks_sent'],4)
+            with self.assertRaises(ValueError):
+                replica.apply_block(encode_block(primary._PandasChain__chain[2]))
+        finally:
+            follower.close()
+            server.close()
+
+    def test_transactions_for(self):
+        pandas_chain = PandasChain('testnet',bloom_fp_rate=0.001)
+        senders, receivers, values = generate_transactions(500, parties=200)
+        pandas_chain.add_transactions(senders,receivers,values)
+        pandas_chain.add_transaction("Zed","Bob",7)
+        found = pandas_chain.transactions_for("Party3")
+        mask = (senders == "Party3") | (receivers == "Party3")
+        self.assertEqual(found['Value'].tolist(),values[mask].tolist())
+        self.assertEqual(pandas_chain.transactions_for("Zed")['Receiver'].tolist(),["Bob"])
+        self.assertEqual(len(pandas_chain.transactions_for("Nobody")),0)
+        stats = pandas_chain.bloom_stats()
+        self.assertEqual(stats['blocks'],50)
+        self.assertGreater(stats['bytes'],0)
+        self.assertEqual(stats['blocks_opened'] - stats['false_positives'],len(set(found['SeqId'][found['SeqId'] < 50])))
+        pandas_chain.set_bloom_fp_rate(0.5)
+        self.assertEqual(len(pandas_chain.transactions_for("Party3")),mask.sum())
+        self.assertLess(pandas_chain.bloom_stats()['bytes'],stats['bytes'])
+
+    def test_archive(self):
+        pandas_chain = PandasChain('testnet',archive=ArchivePolicy(tiers=((2,'zlib'),(4,'lzma')),group_blocks=2,cache_blocks=2))
+        tx_hashes = pandas_chain.add_transactions(["Bob","Carol"] * 50,["Alice"] * 100,range(100))
+        stats = pandas_chain.archive_stats()
+        self.assertEqual(stats['resident'],3)
+        self.assertEqual({codec: tier['blocks'] for codec, tier in stats['tiers'].items()},{'lzma': 4,'zlib': 2})
+        self.assertEqual(pandas_chain.get_values().tolist(),list(range(100)))
+        self.assertEqual(pandas_chain.get_transaction(tx_hashes[3])['Sender'],"Carol")
+        self.assertEqual(pandas_chain.archive_stats()['cached'],2)
+        out = io.StringIO()
+        pandas_chain.display_block_headers(file=out)
+        self.assertEqual(len(out.getvalue().splitlines()),10)
+        self.assertEqual(pandas_chain.archive_stats()['misses'],7)
+        self.assertIsNone(pandas_chain.validate(processes=1))
+        self.assertEqual(pandas_chain.get_balance("Alice"),sum(range(100)))
+        misses = pandas_chain.archive_stats()['misses']
+        with tempfile.TemporaryDirectory() as path:
+            pandas_chain.export(os.path.join(path,'chain.npz'),chunk_rows=15)
+            with np.load(os.path.join(path,'chain.npz')) as data:
+                self.assertEqual(data['value'].tolist(),list(range(100)))
+                self.assertEqual(data['block_size'].tolist(),[10] * 10)
+        self.assertLessEqual(pandas_chain.archive_stats()['misses'] - misses,6)
+        timestamp = pandas_chain.get_transaction(tx_hashes[3])['Timestamp']
+        pandas_chain.add_transaction("Zed","Bob",7)
+        misses = pandas_chain.archive_stats()['misses']
+        self.assertEqual(pandas_chain.query_range(timestamp,timestamp + pd.Timedelta(1,'ns'))['Value'].tolist(),[3.0])
+        self.assertEqual(pandas_chain.transactions_for("Zed")['Value'].tolist(),[7.0])
+        self.assertLessEqual(pandas_chain.archive_stats()['misses'] - misses,2)
+        pandas_chain.close()
+        pandas_chain = PandasChain('testnet',archive=ArchivePolicy(tiers=((1,'zlib'),(2,'zlib')),group_blocks=1,cache_blocks=0))
+        pandas_chain.add_transactions(["Bob"] * 50,["Alice"] * 50,range(50))
+        self.assertEqual(pandas_chain.get_values().tolist(),list(range(50)))
+        pandas_chain.close()
+
+    def test_segment_store(self):
+        with tempfile.TemporaryDirectory() as path:
+            pandas_chain = PandasChain('testnet',path)
+            tx_hashes = [pandas_chain.add_transaction("Bob","Alice",v) for v in range(35)]
+            pandas_chain.close()
+            with open(os.path.join(path,'segment-000000.pcs'),'ab') as f:
+                f.write(b'BLK1 torn block')
+            pandas_chain = PandasChain('testnet',path)
+            self.assertEqual(pandas_chain.get_number_of_blocks(),5)
+            self.assertEqual(pandas_chain.get_transaction(tx_hashes[12])['Value'],12.0)
+            self.assertEqual(pandas_chain.get_balance("Alice"),sum(range(35)))
+            self.assertEqual(verify_proofs([pandas_chain.get_proof(tx_hashes[25])]),[True])
+            for v in range(11):
+                pandas_chain.add_transaction("Carol","Bob",v)
+            self.assertEqual(pandas_chain.get_number_of_blocks(),6)
+            self.assertIsNone(pandas_chain.validate(processes=2))
+            pandas_chain.close()
+            pandas_chain = PandasChain('testnet',os.path.join(path,'background'),background=True)
+            pandas_chain.add_transactions(["Bob"] * 35,["Alice"] * 35,range(35))
+            pandas_chain.flush()
+            self.assertEqual(pandas_chain.get_number_of_blocks(),5)
+            self.assertEqual(pandas_chain.get_values().tolist(),list(range(35)))
+            pandas_chain.close()
+            pandas_chain = PandasChain('testnet',os.path.join(path,'background'))
+            self.assertEqual(pandas_chain.get_number_of_blocks(),5)
+            self.assertIsNone(pandas_chain.validate(processes=1))
+            pandas_chain.close()
+
 if __name__ == '__main__':
-    unittest.main()
+    if sys.argv[1:2] == ['bench']:
+        run_benchmarks(sys.argv[2] if len(sys.argv) > 2 else 'benchmark.json')
+        sys.exit()
+    if sys.argv[1:2] == ['demo']:
+        pc = PandasChain('donald')
 
-   
-pc = PandasChain('donald')
-
-pc.add_transaction("Bob","Alice",50)
-pc.add_transaction("Bob","Alice",51)
-pc.add_transaction("Bob","Alice",52)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-
-pc.add_transaction("Bob","Alice",50)
-pc.add_transaction("Bob","Alice",51)
-pc.add_transaction("Bob","Alice",52)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-
-pc.add_transaction("Bob","Alice",50)
-pc.add_transaction("Bob","Alice",51)
-pc.add_transaction("Bob","Alice",52)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-pc.add_transaction("Bob","Alice",53)
-
-pc.display_chain()
+        pc.add_transaction("Bob","Alice",50)
+        pc.add_transaction("Bob","Alice",51)
+        pc.add_transaction("Bob","Alice",52)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+
+        pc.add_transaction("Bob","Alice",50)
+        pc.add_transaction("Bob","Alice",51)
+        pc.add_transaction("Bob","Alice",52)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+
+        pc.add_transaction("Bob","Alice",50)
+        pc.add_transaction("Bob","Alice",51)
+        pc.add_transaction("Bob","Alice",52)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+        pc.add_transaction("Bob","Alice",53)
+
+        pc.display_chain()
+        sys.exit()
+    unittest.main()